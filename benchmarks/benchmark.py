@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+#
+# Benchmark of tfstate2inventory.py on synthetic terraform state files
+#
+# - For every size a state file is generated with tfstategen.py, and the phases of the inventory generation are
+#   timed one by one in a fresh python process, through the profile of the library API: decode and arrange, which
+#   are the parts of read (native reader, or the streaming one with --stream), walk, floating, hosts and build, then
+#   hoist and emit. The decode phase of the streaming reader includes reading the file, as both are interleaved.
+# - The peak resident memory of the process is recorded after every phase, and for the whole run.
+# - Results are printed (or written to the --output file) as JSON, so that they can be compared over releases.
+#
+# - With --states <count>, the batch mode is benchmarked instead: for every size, that many state files of that many
+#   hosts each are generated and merged by the script, once with --jobs 1 and once with --jobs <count> (the number of
+#   CPU cores by default), and the speedup is reported.
+#
+# The options of tfstategen.py, except --hosts, can be given to shape the generated state files, e.g. '--modules 10 --depth 3'.
+#
+import json
+import getopt
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import tfstategen
+import tfstate2inventory
+
+USAGE = 'Usage: benchmark.py [optional:--sizes <count>,<count>,...] [optional:--stream] [optional:--states <count>] [optional:--jobs <count>] [optional:--output <file>] [optional:<tfstategen.py options except --hosts>]'
+
+SIZES = (100, 1000, 10000, 100000)
+
+# Hosts per state file in the batch mode, where every size is multiplied by the number of state files.
+BATCH_SIZES = (1000,)
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tfstate2inventory.py')
+
+def maxrss():
+  # Peak resident memory of this process in KiB. macOS reports it in bytes.
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak // 1024 if sys.platform == 'darwin' else peak
+
+def measure(statefile, streaming):
+  # Parse a state file and build its inventory through the library API, timing every phase on its own. The records
+  # are collected before the inventory is built, so that parsing them is not counted in the build phase.
+  phases = []
+  def hook(name, seconds):
+    phases.append({'phase': name, 'seconds': round(seconds, 6), 'maxrss_kb': maxrss()})
+  profile = tfstate2inventory.Profile(hook)
+
+  # The INFO messages of the script would otherwise dominate the timings of large states.
+  stderr = sys.stderr
+  sys.stderr = open(os.devnull, 'w')
+  try:
+    start = time.perf_counter()
+    records = list(tfstate2inventory.parse_state(statefile, 'floating', 0, 'openstack_networking_floatingip_v2', 'stream' if streaming else 'native', profile))
+    inventory = tfstate2inventory.build_inventory(records, profile)
+    with profile.phase('hoist'):
+      hoisted = tfstate2inventory.hoist_group_vars(inventory)
+    with profile.phase('emit'):
+      inventorytext = tfstate2inventory.dump_inventory(hoisted, 'yaml')
+    total = time.perf_counter() - start
+  finally:
+    sys.stderr.close()
+    sys.stderr = stderr
+  return {
+    'resources': profile.counts['resources'],
+    'hosts': profile.counts['hosts'],
+    'counts': profile.counts,
+    'inventory_bytes': len(inventorytext.encode('utf-8')),
+    'seconds': round(total, 6),
+    'maxrss_kb': maxrss(),
+    'phases': phases,
+  }
+
+def run(sizes, streaming, generatoroptions):
+  # Generate a state file for every size and measure it in a separate process, so that the peak memory of
+  # one size does not hide the one of the next. Unless given, the number of other resources follows the size.
+  results = []
+  with tempfile.TemporaryDirectory(prefix='tfstatebench') as tmpdir:
+    for size in sizes:
+      options = dict(tfstategen.DEFAULTS)
+      options['others'] = size
+      options.update(generatoroptions)
+      options['hosts'] = size
+      statefile = os.path.join(tmpdir, 'terraform.tfstate')
+      with open(statefile, 'w') as statefd:
+        tfstategen.write_state(statefd, options)
+      command = [sys.executable, os.path.abspath(__file__), '--measure', statefile]
+      if streaming:
+        command.append('--stream')
+      result = {'size': size, 'state_bytes': os.path.getsize(statefile)}
+      result.update(json.loads(subprocess.check_output(command)))
+      results.append(result)
+      os.unlink(statefile)
+  return results
+
+def run_batch(sizes, streaming, states, jobs, generatoroptions):
+  # Generate the given number of state files for every size, and time merging them with one worker process and
+  # with the given number of worker processes. The script runs as a whole, with the cache disabled.
+  results = []
+  for size in sizes:
+    with tempfile.TemporaryDirectory(prefix='tfstatebench') as tmpdir:
+      options = dict(tfstategen.DEFAULTS)
+      options['others'] = size
+      options.update(generatoroptions)
+      options['hosts'] = size
+      statefiles = []
+      for state in range(states):
+        statefile = os.path.join(tmpdir, 'state'+str(state)+'.tfstate')
+        with open(statefile, 'w') as statefd:
+          tfstategen.write_state(statefd, options)
+        statefiles.append(statefile)
+      result = {'size': size, 'states': states, 'state_bytes': sum(os.path.getsize(statefile) for statefile in statefiles), 'runs': []}
+      for workers in sorted(set((1, jobs))):
+        command = [sys.executable, SCRIPT, '--no-cache', '--jobs', str(workers)] + (['--stream'] if streaming else []) + statefiles + ['fixed']
+        start = time.perf_counter()
+        subprocess.check_call(command, cwd=tmpdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        result['runs'].append({'jobs': workers, 'seconds': round(time.perf_counter() - start, 6)})
+      result['speedup'] = round(result['runs'][0]['seconds'] / result['runs'][-1]['seconds'], 3)
+      results.append(result)
+  return results
+
+def main(argv):
+  sizes = None
+  streaming = False
+  states = None
+  jobs = os.cpu_count() or 1
+  output = None
+  measurefile = None
+  generatoroptions = {}
+  longopts = ['sizes=', 'stream', 'states=', 'jobs=', 'output=', 'measure=']
+  longopts += [option+'=' for option in tfstategen.DEFAULTS if option != 'hosts']
+  try:
+    opts, args = getopt.gnu_getopt(argv, '', longopts)
+    if args:
+      raise getopt.GetoptError('unexpected argument '+args[0])
+    for opt, optarg in opts:
+      if opt == '--sizes':
+        sizes = [int(size) for size in optarg.split(',')]
+      elif opt == '--stream':
+        streaming = True
+      elif opt == '--states':
+        states = max(1, int(optarg))
+      elif opt == '--jobs':
+        jobs = max(1, int(optarg))
+      elif opt == '--output':
+        output = optarg
+      elif opt == '--measure':
+        measurefile = optarg
+      else:
+        generatoroptions[opt[2:]] = type(tfstategen.DEFAULTS[opt[2:]])(optarg)
+  except (getopt.GetoptError, ValueError) as opterr:
+    sys.stderr.write('Error ::: '+USAGE+'\n'+str(opterr)+'\n')
+    sys.exit(1)
+
+  if measurefile:
+    print(json.dumps(measure(measurefile, streaming)))
+    return
+
+  report = {
+    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'libyaml': tfstate2inventory.YAML_DUMPER.__name__ == 'CSafeDumper',
+    'cpus': os.cpu_count(),
+    'streaming': streaming,
+    'generator': generatoroptions,
+  }
+  if states:
+    report['results'] = run_batch(sizes or BATCH_SIZES, streaming, states, jobs, generatoroptions)
+  else:
+    report['results'] = run(sizes or SIZES, streaming, generatoroptions)
+  reporttext = json.dumps(report, indent=2)+'\n'
+  if output:
+    with open(output, 'w') as outfile:
+      outfile.write(reporttext)
+  else:
+    sys.stdout.write(reporttext)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
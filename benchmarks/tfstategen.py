@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+#
+# Generator of synthetic terraform state files of version 4, used to benchmark tfstate2inventory.py
+#
+# - The compute instances are spread evenly over the root module and the child modules. Each child module
+#   can contain a chain of nested child modules, down to the given depth.
+# - Every compute instance gets the given number of NICs. Floating ips are associated with NIC 0, using both the
+#   openstack_networking_floatingip_v2 and the openstack_networking_floatingip_associate_v2 resource types.
+# - Other resources (volumes) are added to every module, so that the compute instances are only part of the state.
+#
+# The state is written resource by resource, so that even very large state files can be generated with little memory.
+#
+import json
+import getopt
+import sys
+
+USAGE = 'Usage: tfstategen.py [optional:--hosts <count>] [optional:--nics <count>] [optional:--floating <fraction>] [optional:--associate <fraction>] [optional:--modules <count>] [optional:--depth <levels>] [optional:--groups <count>] [optional:--others <count>] [optional:--output <file>]'
+
+DEFAULTS = {
+  'hosts': 1000,
+  'nics': 1,
+  'floating': 1.0,
+  'associate': 0.5,
+  'modules': 0,
+  'depth': 1,
+  'groups': 10,
+  'others': 1000,
+}
+
+def module_addresses(modules, depth):
+  # Addresses of the root module and of the child modules, each child module with its chain of nested modules.
+  addresses = ['']
+  for child in range(modules):
+    address = 'module.app'+str(child)
+    addresses.append(address)
+    for level in range(1, depth):
+      address = address+'.module.nested'+str(level)
+      addresses.append(address)
+  return addresses
+
+def fixed_ip(host, nic):
+  return '10.'+str(nic * 16 + (host >> 16))+'.'+str((host >> 8) & 255)+'.'+str(host & 255)
+
+def floating_ip(host):
+  return '172.'+str(16 + (host >> 16))+'.'+str((host >> 8) & 255)+'.'+str(host & 255)
+
+def has_floating(host, options):
+  return host % 1000 < options['floating'] * 1000
+
+def uses_associate(host, options):
+  # Spread the two floating ip resource types over the hosts, independently of the modules.
+  return (host * 7919) % 1000 < options['associate'] * 1000
+
+def compute_attributes(host, options):
+  metadata = {
+    'cluster': 'group'+str(host % options['groups']),
+    'ansible_user': 'centos',
+    'ansible_python_interpreter': '/usr/bin/python3',
+  }
+  if host % 10 == 0:
+    metadata['ansible_extra_groups'] = 'monitored,backup'
+  if host % 7 == 0:
+    metadata['ansible_port'] = '2222'
+  network = []
+  for nic in range(options['nics']):
+    network.append({
+      'access_network': False,
+      'fixed_ip_v4': fixed_ip(host, nic),
+      'fixed_ip_v6': '',
+      'floating_ip': '',
+      'mac': 'fa:16:3e:%02x:%02x:%02x' % (nic, (host >> 8) & 255, host & 255),
+      'name': 'network'+str(nic),
+      'port': 'port-'+str(host)+'-'+str(nic),
+      'uuid': 'net-'+str(nic),
+    })
+  return {
+    'access_ip_v4': fixed_ip(host, 0),
+    'availability_zone': 'nova',
+    'flavor_name': 'm1.small',
+    'id': 'instance-'+str(host),
+    'image_name': 'centos-8',
+    'key_pair': 'deploy',
+    'metadata': metadata,
+    'name': 'host-%06d' % host,
+    'network': network,
+    'power_state': 'active',
+    'region': 'RegionOne',
+    'security_groups': ['default'],
+    'tags': [],
+  }
+
+def floating_attributes(host, floatingtype):
+  if floatingtype == 'openstack_networking_floatingip_associate_v2':
+    return {'fixed_ip': fixed_ip(host, 0), 'floating_ip': floating_ip(host), 'id': 'associate-'+str(host), 'port_id': 'port-'+str(host)+'-0', 'region': 'RegionOne'}
+  return {'address': floating_ip(host), 'description': '', 'fixed_ip': fixed_ip(host, 0), 'id': 'floatingip-'+str(host), 'pool': 'public', 'port_id': 'port-'+str(host)+'-0', 'region': 'RegionOne', 'tags': []}
+
+def volume_attributes(volume):
+  return {'description': 'synthetic volume '+str(volume), 'id': 'volume-'+str(volume), 'metadata': {'backup': 'daily', 'owner': 'benchmark'}, 'name': 'volume-'+str(volume), 'region': 'RegionOne', 'size': 10, 'volume_type': 'standard'}
+
+def write_resource(statefd, first, module, resourcetype, name, instances):
+  # Write one resource with all its instances, instance by instance. Returns False when nothing was written.
+  wrote = False
+  for index_key, attributes in instances:
+    if not wrote:
+      resource = {'mode': 'managed', 'type': resourcetype, 'name': name, 'provider': 'provider.openstack'}
+      if module:
+        resource = dict([('module', module)] + list(resource.items()))
+      statefd.write(('' if first else ',\n')+json.dumps(resource)[:-1]+', "instances": [\n')
+    else:
+      statefd.write(',\n')
+    statefd.write(json.dumps({'index_key': index_key, 'schema_version': 0, 'attributes': attributes, 'private': 'bnVsbA=='}))
+    wrote = True
+  if wrote:
+    statefd.write(']}')
+  return wrote
+
+def write_state(statefd, options):
+  # Write a synthetic version 4 state file with the given options.
+  modules = module_addresses(options['modules'], options['depth'])
+  statefd.write('{"version": 4, "terraform_version": "0.12.31", "serial": 1, "lineage": "tfstategen-'+str(options['hosts'])+'", "outputs": {}, "resources": [\n')
+  first = True
+  for moduleindex, module in enumerate(modules):
+    hosts = range(moduleindex, options['hosts'], len(modules))
+    volumes = range(moduleindex, options['others'], len(modules))
+    instances = ((index, compute_attributes(host, options)) for index, host in enumerate(hosts))
+    first = not write_resource(statefd, first, module, 'openstack_compute_instance_v2', 'host', instances) and first
+    for floatingtype, name, associate in (('openstack_networking_floatingip_v2', 'floatingip', False), ('openstack_networking_floatingip_associate_v2', 'floatingip_associate', True)):
+      instances = ((index, floating_attributes(host, floatingtype)) for index, host in enumerate(hosts) if has_floating(host, options) and uses_associate(host, options) == associate)
+      first = not write_resource(statefd, first, module, floatingtype, name, instances) and first
+    instances = ((index, volume_attributes(volume)) for index, volume in enumerate(volumes))
+    first = not write_resource(statefd, first, module, 'openstack_blockstorage_volume_v2', 'volume', instances) and first
+  statefd.write('\n]}\n')
+
+def parse_options(argv):
+  # Parse the generator options. Returns the options and the output file, None for the standard output.
+  options = dict(DEFAULTS)
+  output = None
+  opts, args = getopt.gnu_getopt(argv, '', [option+'=' for option in DEFAULTS] + ['output='])
+  if args:
+    raise getopt.GetoptError('unexpected argument '+args[0])
+  for opt, optarg in opts:
+    if opt == '--output':
+      output = optarg
+    elif isinstance(DEFAULTS[opt[2:]], float):
+      options[opt[2:]] = float(optarg)
+    else:
+      options[opt[2:]] = int(optarg)
+  return options, output
+
+if __name__ == '__main__':
+  try:
+    options, output = parse_options(sys.argv[1:])
+  except (getopt.GetoptError, ValueError) as opterr:
+    sys.stderr.write('Error ::: '+USAGE+'\n'+str(opterr)+'\n')
+    sys.exit(1)
+  if output:
+    with open(output, 'w') as statefd:
+      write_state(statefd, options)
+  else:
+    write_state(sys.stdout, options)
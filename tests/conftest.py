@@ -0,0 +1,21 @@
+#
+# The script and the state generator are single files, not packages. Make both importable by the tests.
+#
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import tfstategen
+
+def generated_state(settings):
+  # Text of a state file generated by tfstategen, with the given settings instead of its defaults.
+  options = dict(tfstategen.DEFAULTS)
+  options.update(settings)
+  statefd = io.StringIO()
+  tfstategen.write_state(statefd, options)
+  return statefd.getvalue()
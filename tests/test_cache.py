@@ -0,0 +1,108 @@
+#
+# Inventory cache of local state files, and the arguments of the dynamic inventory mode
+#
+import json
+import os
+import time
+
+import pytest
+
+import tfstate2inventory
+
+def write_state(statefile, serial, hosts):
+  resources = []
+  for name, address in hosts:
+    resources.append({'mode': 'managed', 'type': 'openstack_compute_instance_v2', 'name': name, 'provider': 'provider.openstack',
+      'instances': [{'schema_version': 0, 'attributes': {'id': 'id-'+name, 'name': name, 'metadata': {'cluster': 'web'}, 'network': [{'fixed_ip_v4': address, 'port': 'port-'+name}]}}]})
+  with open(statefile, 'w') as statefd:
+    json.dump({'version': 4, 'terraform_version': '0.12.31', 'serial': serial, 'lineage': 'lineage-1', 'outputs': {}, 'resources': resources}, statefd)
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+  # A state file, the options of a run with its own cache, and the number of times the state was parsed.
+  statefile = str(tmp_path / 'terraform.tfstate')
+  write_state(statefile, 1, [('web-1', '10.0.0.1')])
+  parsed = []
+  parse_state = tfstate2inventory.parse_state
+  def counted_parse_state(*args, **kwargs):
+    parsed.append(args[0])
+    return parse_state(*args, **kwargs)
+  monkeypatch.setattr(tfstate2inventory, 'parse_state', counted_parse_state)
+  monkeypatch.chdir(str(tmp_path))
+  options = tfstate2inventory.Options(iptype='fixed', cachedir=str(tmp_path / 'cache'))
+  return statefile, options, parsed
+
+def hosts(inventory):
+  return inventory['all']['children']['web']['hosts']
+
+def test_same_serial_is_not_parsed_again(state):
+  statefile, options, parsed = state
+  inventory = tfstate2inventory.location_inventory(statefile, options)
+  assert tfstate2inventory.location_inventory(statefile, options) == inventory
+  assert len(parsed) == 1
+
+  # The cache is keyed by the options too.
+  options.iptype = 'floating'
+  tfstate2inventory.location_inventory(statefile, options)
+  assert len(parsed) == 2
+
+def test_serial_bump_invalidates_the_cache(state):
+  statefile, options, parsed = state
+  tfstate2inventory.location_inventory(statefile, options)
+  write_state(statefile, 2, [('web-1', '10.0.0.1'), ('web-2', '10.0.0.2')])
+  assert sorted(hosts(tfstate2inventory.location_inventory(statefile, options))) == ['web-1', 'web-2']
+  assert len(parsed) == 2
+
+def test_expired_entry_is_not_used(state, monkeypatch):
+  statefile, options, parsed = state
+  tfstate2inventory.location_inventory(statefile, options)
+  now = time.time()
+  monkeypatch.setattr(time, 'time', lambda: now + options.cachettl + 1)
+  tfstate2inventory.location_inventory(statefile, options)
+  assert len(parsed) == 2
+  # The entry was renewed.
+  tfstate2inventory.location_inventory(statefile, options)
+  assert len(parsed) == 2
+
+def test_refresh_regenerates_the_entry(state):
+  statefile, options, parsed = state
+  tfstate2inventory.location_inventory(statefile, options)
+  options.refresh = True
+  tfstate2inventory.location_inventory(statefile, options)
+  assert len(parsed) == 2
+  options.refresh = False
+  tfstate2inventory.location_inventory(statefile, options)
+  assert len(parsed) == 2
+
+def test_no_cache(state):
+  statefile, options, parsed = state
+  options.usecache = False
+  tfstate2inventory.location_inventory(statefile, options)
+  tfstate2inventory.location_inventory(statefile, options)
+  assert len(parsed) == 2
+  assert not os.path.exists(options.cachedir)
+
+def run(args, capsys):
+  try:
+    tfstate2inventory.main(args)
+  except SystemExit as exit:
+    assert exit.code == 0
+  return capsys.readouterr().out
+
+def test_arguments_from_the_environment(state, monkeypatch, capsys):
+  statefile, options, parsed = state
+  monkeypatch.setenv('TFSTATE2INVENTORY_ARGS', '--cache-dir '+options.cachedir+' '+statefile+' fixed')
+  listing = json.loads(run(['--list'], capsys))
+  assert listing['web']['hosts'] == ['web-1']
+  assert listing['_meta']['hostvars'] == {'web-1': {'ansible_host': '10.0.0.1'}}
+  assert json.loads(run(['--host', 'web-1'], capsys)) == {'ansible_host': '10.0.0.1'}
+  assert json.loads(run(['--host', 'web-9'], capsys)) == {}
+  # Ansible runs the script for every host, which only parses the state once.
+  assert len(parsed) == 1
+
+def test_inventory_file_is_not_cached(state, capsys):
+  statefile, options, parsed = state
+  run(['--cache-dir', options.cachedir, statefile, 'fixed'], capsys)
+  run(['--cache-dir', options.cachedir, statefile, 'fixed'], capsys)
+  assert len(parsed) == 2
+  assert not os.path.exists(options.cachedir)
@@ -0,0 +1,123 @@
+#
+# Fetching remote state files from a local http server that counts what it serves
+#
+import gzip
+import hashlib
+import http.server
+import socket
+import threading
+
+import pytest
+
+import tfstate2inventory
+from conftest import generated_state
+
+class StateHandler(http.server.BaseHTTPRequestHandler):
+  # Serve the state files of the server by path, with an ETag, gzip encoded when the server is set to.
+  protocol_version = 'HTTP/1.1'
+
+  def setup(self):
+    http.server.BaseHTTPRequestHandler.setup(self)
+    self.server.connections += 1
+
+  def do_GET(self):
+    body = self.server.files.get(self.path)
+    if body is None:
+      self.send_response(404)
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+      self.server.statuses.append(404)
+      return
+    etag = '"'+hashlib.sha256(body).hexdigest()+'"'
+    if self.headers.get('If-None-Match') == etag:
+      self.send_response(304)
+      self.send_header('ETag', etag)
+      self.end_headers()
+      self.server.statuses.append(304)
+      return
+    self.send_response(200)
+    if self.server.gzip and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+      body = gzip.compress(body)
+      self.send_header('Content-Encoding', 'gzip')
+    self.send_header('Content-Length', str(len(body)))
+    self.send_header('ETag', etag)
+    self.end_headers()
+    self.wfile.write(body)
+    self.server.bodybytes += len(body)
+    self.server.statuses.append(200)
+
+  def log_message(self, format, *args):
+    pass
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+  # Serve two state files on 127.0.0.1, and run every test with its own cache and connection pool.
+  httpserver = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StateHandler)
+  httpserver.daemon_threads = True
+  httpserver.files = {
+    '/a.tfstate': generated_state({'hosts': 500, 'others': 500}).encode('utf-8'),
+    '/b.tfstate': generated_state({'hosts': 200, 'others': 200}).encode('utf-8'),
+  }
+  httpserver.gzip = False
+  httpserver.connections = 0
+  httpserver.bodybytes = 0
+  httpserver.statuses = []
+  httpserver.url = 'http://127.0.0.1:'+str(httpserver.server_address[1])
+  thread = threading.Thread(target=httpserver.serve_forever, daemon=True)
+  thread.start()
+  monkeypatch.setenv('no_proxy', '*')
+  monkeypatch.setattr(tfstate2inventory, 'connections', threading.local())
+  httpserver.options = tfstate2inventory.Options(iptype='fixed', cachedir=str(tmp_path / 'cache'))
+  yield httpserver
+  for connection, proxied in tfstate2inventory.connection_pool().values():
+    connection.close()
+  httpserver.shutdown()
+  httpserver.server_close()
+
+def hosts(inventory):
+  return sorted(name for group in inventory['all']['children'].values() for name, hostvars in group['hosts'].items() if hostvars is not None)
+
+def test_unchanged_state_is_not_downloaded_again(server):
+  inventory = tfstate2inventory.location_inventory(server.url+'/a.tfstate', server.options)
+  assert server.bodybytes == len(server.files['/a.tfstate'])
+  assert len(hosts(inventory)) == 500
+
+  cachedinventory = tfstate2inventory.location_inventory(server.url+'/a.tfstate', server.options)
+  assert server.statuses == [200, 304]
+  assert server.bodybytes == len(server.files['/a.tfstate'])
+  assert cachedinventory == inventory
+
+def test_gzip_encoded_state_is_decoded(server):
+  server.options.usecache = False
+  plaininventory = tfstate2inventory.location_inventory(server.url+'/a.tfstate', server.options)
+  plainbytes = server.bodybytes
+  server.gzip = True
+  gzipinventory = tfstate2inventory.location_inventory(server.url+'/a.tfstate', server.options)
+  assert server.bodybytes - plainbytes < plainbytes / 4
+  assert gzipinventory == plaininventory
+
+def test_connection_is_reused_across_urls(server):
+  server.options.usecache = False
+  for path in ('/a.tfstate', '/b.tfstate', '/a.tfstate'):
+    tfstate2inventory.location_inventory(server.url+path, server.options)
+  assert server.statuses == [200, 200, 200]
+  assert server.connections == 1
+
+def test_missing_state_is_reported(server):
+  with pytest.raises(tfstate2inventory.InventoryError) as inverr:
+    tfstate2inventory.location_inventory(server.url+'/missing.tfstate', server.options)
+  assert inverr.value.code == 708
+
+def test_unresponsive_server_times_out(server, monkeypatch):
+  # A server that accepts the connection but never answers.
+  listener = socket.socket()
+  listener.bind(('127.0.0.1', 0))
+  listener.listen(1)
+  monkeypatch.setattr(tfstate2inventory, 'HTTP_TIMEOUT', 0.5)
+  try:
+    with pytest.raises(tfstate2inventory.InventoryError) as inverr:
+      tfstate2inventory.location_inventory('http://127.0.0.1:'+str(listener.getsockname()[1])+'/a.tfstate', server.options)
+  finally:
+    listener.close()
+  assert inverr.value.code == 708
+  assert 'timed out' in inverr.value.message
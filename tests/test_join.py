@@ -0,0 +1,61 @@
+#
+# Join of compute instances with their floating ips on a large generated state
+#
+import json
+
+import tfstategen
+import tfstate2inventory
+from conftest import generated_state
+
+HOSTS = 50000
+
+def floating_resource(name, address, fixedip, portid):
+  return {'mode': 'managed', 'type': 'openstack_networking_floatingip_v2', 'name': name, 'provider': 'provider.openstack',
+    'instances': [{'schema_version': 0, 'attributes': {'address': address, 'fixed_ip': fixedip, 'port_id': portid}}]}
+
+def test_join_floating_ips(capsys):
+  options = dict(tfstategen.DEFAULTS)
+  options.update({'hosts': HOSTS, 'others': 0, 'floating': 0.9, 'modules': 4, 'depth': 2})
+  state = json.loads(generated_state(options))
+  # Floating ips without an association, which must not be reported as duplicates, and a second floating ip
+  # for the fixed ip of host 18, which must be reported. Host 18 is in the root module and its floating ip is an
+  # openstack_networking_floatingip_v2 one. Resources are sorted by address, so the second floating ip is the last one.
+  for index in range(3):
+    state['resources'].append(floating_resource('unassociated'+str(index), '192.0.2.'+str(index), '', None))
+  state['resources'].append(floating_resource('zduplicate', '198.51.100.1', tfstategen.fixed_ip(18, 0), None))
+  # Host 2 is only found by its port id.
+  for resource in state['resources']:
+    for instance in resource['instances']:
+      if resource['type'] == 'openstack_networking_floatingip_v2' and instance['attributes']['port_id'] == 'port-2-0':
+        instance['attributes']['fixed_ip'] = ''
+
+  profile = tfstate2inventory.Profile()
+  records = list(tfstate2inventory.parse_state(state, 'floating', 0, 'openstack_networking_floatingip_v2', profile=profile))
+  stderr = capsys.readouterr().err
+
+  assert len(records) == HOSTS
+  expected = {}
+  for host in range(HOSTS):
+    if tfstategen.has_floating(host, options) and not tfstategen.uses_associate(host, options):
+      expected['host-%06d' % host] = tfstategen.floating_ip(host)
+  assert expected['host-000018'] == tfstategen.floating_ip(18)
+  expected['host-000018'] = '198.51.100.1'
+  for record in records:
+    assert record.floating_ip == expected.get(record.name)
+    assert record.ansible_host == record.floating_ip
+  assert profile.counts['floating_missing'] == HOSTS - len(expected)
+
+  assert 'Fixed ip '+tfstategen.fixed_ip(18, 0)+' is associated with more than one floating ip' in stderr
+  assert stderr.count('is associated with more than one floating ip') == 1
+
+def test_join_associate_and_fixed():
+  options = dict(tfstategen.DEFAULTS)
+  options.update({'hosts': 1000, 'others': 0, 'nics': 2})
+  state = json.loads(generated_state(options))
+
+  for record in tfstate2inventory.parse_state(state, 'floating', 0, 'openstack_networking_floatingip_associate_v2'):
+    host = int(record.name.split('-')[1])
+    assert record.floating_ip == (tfstategen.floating_ip(host) if tfstategen.uses_associate(host, options) else None)
+  for record in tfstate2inventory.parse_state(state, 'fixed', 1):
+    host = int(record.name.split('-')[1])
+    assert record.ansible_host == tfstategen.fixed_ip(host, 1)
@@ -0,0 +1,106 @@
+#
+# Merging the inventories of several small state files
+#
+import json
+import os
+
+import pytest
+import yaml
+
+import tfstate2inventory
+
+def instance(name, group, address, extragroups=None, user=None):
+  metadata = {'cluster': group}
+  if extragroups:
+    metadata['ansible_extra_groups'] = extragroups
+  if user:
+    metadata['ansible_user'] = user
+  return {'mode': 'managed', 'type': 'openstack_compute_instance_v2', 'name': name, 'provider': 'provider.openstack',
+    'instances': [{'schema_version': 0, 'attributes': {'id': 'id-'+name, 'name': name, 'metadata': metadata, 'network': [{'fixed_ip_v4': address, 'port': 'port-'+name}]}}]}
+
+def write_state(path, *resources):
+  os.makedirs(str(path.parent), exist_ok=True)
+  with open(str(path), 'w') as statefd:
+    json.dump({'version': 4, 'terraform_version': '0.12.31', 'serial': 1, 'lineage': 'lineage-'+path.parent.name, 'outputs': {}, 'resources': list(resources)}, statefd)
+  return str(path)
+
+def run(args, capsys):
+  # Run the script, and return its exit code, its inventory and its standard error.
+  try:
+    tfstate2inventory.main(['--no-cache', '--jobs', '2'] + args)
+    returncode = 0
+  except SystemExit as exit:
+    returncode = exit.code
+  captured = capsys.readouterr()
+  return returncode, yaml.safe_load(captured.out) if captured.out else None, captured.err
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+  monkeypatch.chdir(str(tmp_path))
+
+def test_conflicting_host_keeps_first_state(tmp_path, capsys):
+  first = write_state(tmp_path / 'a' / 'terraform.tfstate', instance('web-1', 'web', '10.0.0.1', 'backup'))
+  second = write_state(tmp_path / 'b' / 'terraform.tfstate',
+    instance('web-1', 'web', '10.0.0.9', 'monitor'), instance('web-2', 'web', '10.0.0.2', 'monitor'))
+  returncode, inventory, stderr = run([first, second, 'fixed'], capsys)
+  assert returncode == 0
+  groups = inventory['all']['children']
+  assert groups['web']['hosts'] == {'web-1': {'ansible_host': '10.0.0.1'}, 'web-2': {'ansible_host': '10.0.0.2'}}
+  assert groups['backup']['hosts'] == {'web-1': None}
+  # The conflicting host of the second state is dropped with its references.
+  assert groups['monitor']['hosts'] == {'web-2': None}
+  assert 'Host web-1 of ['+second+'] is already defined by ['+first+'] with different variables' in stderr
+
+def test_identical_host_is_merged(tmp_path, capsys):
+  first = write_state(tmp_path / 'a' / 'terraform.tfstate', instance('web-1', 'web', '10.0.0.1', 'backup', 'centos'))
+  second = write_state(tmp_path / 'b' / 'terraform.tfstate', instance('web-1', 'web', '10.0.0.1', 'monitor', 'centos'))
+  returncode, inventory, stderr = run([first, second, 'fixed'], capsys)
+  assert returncode == 0
+  groups = inventory['all']['children']
+  assert groups['web']['hosts'] == {'web-1': {'ansible_host': '10.0.0.1', 'ansible_user': 'centos'}}
+  assert groups['backup']['hosts'] == {'web-1': None}
+  assert groups['monitor']['hosts'] == {'web-1': None}
+  assert 'already defined' not in stderr
+
+def test_group_prefix(tmp_path, capsys):
+  prod = write_state(tmp_path / 'prod' / 'terraform.tfstate', instance('web-1', 'web', '10.0.0.1'))
+  test = write_state(tmp_path / 'test' / 'test.tfstate', instance('web-2', 'web', '10.0.1.1'))
+  returncode, inventory, stderr = run(['--group-prefix', prod, test, 'fixed'], capsys)
+  assert returncode == 0
+  assert inventory['all']['children'] == {'prod_web': {'hosts': {'web-1': {'ansible_host': '10.0.0.1'}}}, 'test_web': {'hosts': {'web-2': {'ansible_host': '10.0.1.1'}}}}
+
+def test_state_labels_of_same_directory_names():
+  assert tfstate2inventory.state_label('envs/prod/terraform.tfstate') == 'prod'
+  assert tfstate2inventory.state_label('https://example.com/states/prod-eu.tfstate') == 'prod_eu'
+  assert tfstate2inventory.state_labels(['prod/eu/terraform.tfstate', 'test/eu/terraform.tfstate', 'prod/us/terraform.tfstate']) == ['prod_eu', 'test_eu', 'us']
+  assert tfstate2inventory.state_labels(['https://a.example.com/prod/terraform.tfstate', 'https://b.example.com/prod/terraform.tfstate']) == ['prod_1', 'prod_2']
+
+def test_group_prefix_of_same_directory_names(tmp_path, capsys):
+  prod = write_state(tmp_path / 'prod' / 'eu' / 'terraform.tfstate', instance('web-1', 'web', '10.0.0.1'))
+  test = write_state(tmp_path / 'test' / 'eu' / 'terraform.tfstate', instance('web-2', 'web', '10.0.1.1'))
+  returncode, inventory, stderr = run(['--group-prefix', str(tmp_path / '*' / 'eu' / 'terraform.tfstate'), 'fixed'], capsys)
+  assert returncode == 0
+  assert sorted(inventory['all']['children']) == ['prod_eu_web', 'test_eu_web']
+
+def test_failing_location(tmp_path, capsys):
+  first = write_state(tmp_path / 'a' / 'terraform.tfstate', instance('web-1', 'web', '10.0.0.1'))
+  missing = str(tmp_path / 'missing' / 'terraform.tfstate')
+  returncode, inventory, stderr = run([first, missing, 'fixed'], capsys)
+  assert returncode == 715
+  assert inventory['all']['children'] == {'web': {'hosts': {'web-1': {'ansible_host': '10.0.0.1'}}}}
+  assert 'Error[710] ::: Input file ['+missing+'] could not be found or read.' in stderr
+  assert 'Error[715] ::: 1 of 2 terraform state files could not be processed.' in stderr
+
+def test_all_locations_failing(tmp_path, capsys):
+  returncode, inventory, stderr = run([str(tmp_path / 'a.tfstate'), str(tmp_path / 'b.tfstate'), 'fixed'], capsys)
+  assert returncode == 715
+  assert inventory is None
+  assert not os.path.exists(str(tmp_path / 'inventory'))
+  assert 'Error[715] ::: None of the 2 terraform state files could be processed.' in stderr
+
+def test_misspelled_ip_type(tmp_path, capsys):
+  first = write_state(tmp_path / 'a' / 'terraform.tfstate', instance('web-1', 'web', '10.0.0.1'))
+  assert run([first, 'flaoting'], capsys)[0] == 704
+  assert run([first, 'fixd', '0'], capsys)[0] == 703
+  assert run([first, 'flaoting', '0', 'ip'], capsys)[0] == 701
+  assert run([first, 'fixed', '0', 'ip'], capsys)[0] == 0
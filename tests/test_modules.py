@@ -0,0 +1,26 @@
+#
+# Walk of a deep module tree, with hosts in nested child modules down to depth 10
+#
+import io
+import json
+
+import pytest
+
+import tfstategen
+import tfstate2inventory
+from conftest import generated_state
+
+HOSTS = 2000
+
+@pytest.mark.parametrize('reader', ['native', 'stream'])
+def test_hosts_of_nested_modules(reader):
+  statetext = generated_state({'hosts': HOSTS, 'others': 200, 'modules': 5, 'depth': 10})
+  source = json.loads(statetext) if reader == 'native' else io.StringIO(statetext)
+
+  profile = tfstate2inventory.Profile()
+  records = list(tfstate2inventory.parse_state(source, 'fixed', 0, reader=reader, profile=profile))
+  assert sorted(record.name for record in records) == ['host-%06d' % host for host in range(HOSTS)]
+  for record in records:
+    assert record.ansible_host == tfstategen.fixed_ip(int(record.name.split('-')[1]), 0)
+  # Every resource of the 51 modules is walked exactly once.
+  assert profile.counts['resources'] == 2 * HOSTS + (200 if reader == 'native' else 0)
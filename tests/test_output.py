@@ -0,0 +1,55 @@
+#
+# Group vars hoisting and the output formats of the inventory
+#
+import os
+
+import pytest
+
+import tfstate2inventory
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+def record(name, group, address, extragroups=(), port=None, user=None, keyfile=None, python=None):
+  return tfstate2inventory.HostRecord(name, 'id-'+name, group, extragroups, address, 'port-'+name, address, address, port, user, keyfile, python)
+
+RECORDS = [
+  # Every host of web shares the user and the interpreter, but not the port.
+  record('web-1', 'web', '10.0.0.1', ('frontend', 'monitored'), 22, 'centos', None, '/usr/bin/python3'),
+  record('web-2', 'web', '10.0.0.2', ('frontend',), 2222, 'centos', None, '/usr/bin/python3'),
+  # The hosts of db differ in their user, and only one has a key file.
+  record('db-1', 'db', '10.0.1.1', ('monitored',), None, 'postgres', '/keys/db key', '/usr/bin/python3'),
+  record('db-2', 'db', '10.0.1.2', (), None, 'root', None, '/usr/bin/python3'),
+  # A group of a single host keeps the variables on the host.
+  record('bastion', 'edge', None, ('monitored',), None, 'admin'),
+]
+
+def resolve(inventory):
+  # Variables of every host as ansible resolves them: the vars of all its groups, then its own variables.
+  groups = inventory['all']['children']
+  resolved = {}
+  for group in sorted(groups):
+    for name in groups[group]['hosts']:
+      resolved.setdefault(name, {}).update(groups[group].get('vars', {}))
+  for group in groups:
+    for name, hostvars in groups[group]['hosts'].items():
+      resolved[name].update(hostvars or {})
+  return resolved
+
+def test_hoisting_keeps_host_variables():
+  inventory = tfstate2inventory.build_inventory(RECORDS)
+  hoisted = tfstate2inventory.hoist_group_vars(inventory)
+  assert resolve(hoisted) == resolve(inventory)
+  groups = hoisted['all']['children']
+  assert groups['web']['vars'] == {'ansible_user': 'centos', 'ansible_python_interpreter': '/usr/bin/python3'}
+  assert groups['db']['vars'] == {'ansible_python_interpreter': '/usr/bin/python3'}
+  assert 'vars' not in groups['edge']
+  assert groups['edge']['hosts'] == {'bastion': {'ansible_host': None, 'ansible_user': 'admin'}}
+  # Extra groups only refer to their hosts, and bastion has no interpreter, so monitored hoists nothing.
+  assert groups['frontend'] == {'hosts': {'web-1': None, 'web-2': None}, 'vars': {'ansible_user': 'centos', 'ansible_python_interpreter': '/usr/bin/python3'}}
+  assert groups['monitored'] == {'hosts': {'web-1': None, 'db-1': None, 'bastion': None}}
+
+@pytest.mark.parametrize('outputformat', ['ini', 'json'])
+def test_output_format(outputformat):
+  inventory = tfstate2inventory.hoist_group_vars(tfstate2inventory.build_inventory(RECORDS))
+  with open(os.path.join(DATA, 'inventory.'+outputformat)) as goldenfd:
+    assert tfstate2inventory.dump_inventory(inventory, outputformat) == goldenfd.read()
@@ -0,0 +1,37 @@
+#
+# Reading a version 4 state file natively, against the 'terraform show -json' output of the same state
+#
+import json
+import os
+
+import pytest
+
+import tfstate2inventory
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+STATEFILE = os.path.join(DATA, 'terraform.tfstate')
+
+def show_document():
+  with open(os.path.join(DATA, 'terraform-show.json')) as showfd:
+    return json.load(showfd)
+
+def test_state_is_arranged_like_terraform_show():
+  with open(STATEFILE) as statefd:
+    assert tfstate2inventory.read_state(statefd, STATEFILE) == show_document()
+
+@pytest.mark.parametrize('ip_type, floating_module', [
+  ('fixed', 'openstack_networking_floatingip_v2'),
+  ('floating', 'openstack_networking_floatingip_v2'),
+  ('floating', 'openstack_networking_floatingip_associate_v2'),
+])
+def test_readers_give_the_same_inventory(ip_type, floating_module):
+  showinventory = tfstate2inventory.build_inventory(tfstate2inventory.parse_state(show_document(), ip_type, 0, floating_module))
+  for reader in ('native', 'stream'):
+    records = tfstate2inventory.parse_state(STATEFILE, ip_type, 0, floating_module, reader)
+    assert tfstate2inventory.build_inventory(records) == showinventory
+
+def test_deposed_objects_are_not_hosts():
+  records = list(tfstate2inventory.parse_state(show_document(), 'floating', 0, 'openstack_networking_floatingip_associate_v2'))
+  assert sorted(record.name for record in records) == ['bastion', 'db-primary', 'db-replica', 'web-0', 'web-1']
+  web = [record for record in records if record.name == 'web-1'][0]
+  assert (web.id, web.fixed_ip, web.floating_ip, web.ansible_user) == ('id-web-1', '10.0.1.11', '203.0.113.21', 'centos')
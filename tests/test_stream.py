@@ -0,0 +1,54 @@
+#
+# Memory ceiling of the streaming reader on a large generated state
+#
+import os
+import subprocess
+import sys
+
+import tfstategen
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tfstate2inventory.py')
+
+# Peak resident memory allowed for --stream, in KiB. The generated state is larger than this, so the bound only
+# holds when the state is never held in memory as a whole.
+MAXRSS_KB = 64 * 1024
+
+# Runs a command and prints its exit code and the peak resident memory of the command alone.
+WAIT4 = 'import os, subprocess, sys; process = subprocess.Popen(sys.argv[1:], stdout=subprocess.DEVNULL); pid, status, rusage = os.wait4(process.pid, 0); print(os.waitstatus_to_exitcode(status), rusage.ru_maxrss)'
+
+def run_maxrss(args, cwd):
+  # Run the script in a child process and return its exit code and its peak resident memory in KiB. On Linux a
+  # forked child starts with the peak of its parent, so the script is started from a small wrapper process
+  # instead of from the test process, which can be large.
+  output = subprocess.check_output([sys.executable, '-c', WAIT4, sys.executable, SCRIPT, '--no-cache'] + args, cwd=cwd, stderr=subprocess.DEVNULL)
+  returncode, maxrss = [int(value) for value in output.split()]
+  return returncode, maxrss // 1024 if sys.platform == 'darwin' else maxrss
+
+def test_stream_memory_ceiling(tmp_path):
+  # A state of about 45 MB, most of it other resources, like the states of large projects.
+  options = dict(tfstategen.DEFAULTS)
+  options.update({'hosts': 2000, 'others': 150000})
+  statefile = str(tmp_path / 'terraform.tfstate')
+  with open(statefile, 'w') as statefd:
+    tfstategen.write_state(statefd, options)
+  assert os.path.getsize(statefile) > MAXRSS_KB * 1024 * 0.6
+
+  returncode, maxrss = run_maxrss(['--stream', statefile, 'fixed'], str(tmp_path))
+  assert returncode == 0
+  assert maxrss < MAXRSS_KB
+  with open(str(tmp_path / 'inventory')) as inventoryfd:
+    assert inventoryfd.read().count('ansible_host:') == 2000
+
+def test_stream_below_native_with_many_hosts(tmp_path):
+  # With count, all compute instances are in one resource. Reading them one at a time must take less memory than
+  # reading the whole state natively.
+  options = dict(tfstategen.DEFAULTS)
+  options.update({'hosts': 20000, 'others': 0})
+  statefile = str(tmp_path / 'terraform.tfstate')
+  with open(statefile, 'w') as statefd:
+    tfstategen.write_state(statefd, options)
+
+  streamcode, streammaxrss = run_maxrss(['--stream', statefile, 'fixed'], str(tmp_path))
+  nativecode, nativemaxrss = run_maxrss([statefile, 'fixed'], str(tmp_path))
+  assert streamcode == 0 and nativecode == 0
+  assert streammaxrss < nativemaxrss * 0.9
@@ -0,0 +1,99 @@
+#
+# Incremental updates of the watch mode, and waiting for changes of a state file
+#
+import copy
+import os
+import threading
+
+import tfstate2inventory
+
+def inventory(groups):
+  return {'all': {'children': dict((group, {'hosts': hosts}) for group, hosts in groups.items())}}
+
+PREVIOUS = inventory({
+  'web': {'web-1': {'ansible_host': '10.0.0.1'}, 'web-2': {'ansible_host': '10.0.0.2'}},
+  'db': {'db-1': {'ansible_host': '10.0.1.1'}},
+  'backup': {'db-1': None, 'web-1': None},
+})
+
+# web-2 is removed, db-1 moves to another address and leaves the backup group, web-3 is added in a new group.
+CURRENT = inventory({
+  'web': {'web-1': {'ansible_host': '10.0.0.1'}},
+  'db': {'db-1': {'ansible_host': '10.0.1.9'}},
+  'backup': {'web-1': None},
+  'cache': {'web-3': {'ansible_host': '10.0.2.1'}},
+})
+
+def test_host_table():
+  table = tfstate2inventory.host_table(PREVIOUS)
+  assert table == {
+    'web-1': {'web': {'ansible_host': '10.0.0.1'}, 'backup': None},
+    'web-2': {'web': {'ansible_host': '10.0.0.2'}},
+    'db-1': {'db': {'ansible_host': '10.0.1.1'}, 'backup': None},
+  }
+
+def test_inventory_changes():
+  previoustable = tfstate2inventory.host_table(PREVIOUS)
+  currenttable = tfstate2inventory.host_table(CURRENT)
+  assert tfstate2inventory.inventory_changes(previoustable, currenttable) == (['web-3'], ['web-2'], ['db-1'])
+  assert tfstate2inventory.inventory_changes(previoustable, previoustable) == ([], [], [])
+
+def test_apply_changes():
+  previoustable = tfstate2inventory.host_table(PREVIOUS)
+  currenttable = tfstate2inventory.host_table(CURRENT)
+  added, removed, changed = tfstate2inventory.inventory_changes(previoustable, currenttable)
+  updated = copy.deepcopy(PREVIOUS)
+  groups = tfstate2inventory.apply_changes(updated, previoustable, currenttable, added + removed + changed)
+  assert updated == CURRENT
+  assert groups == {'web', 'db', 'backup', 'cache'}
+
+  # Groups left without hosts are removed.
+  emptied = copy.deepcopy(CURRENT)
+  currenttable = tfstate2inventory.host_table(CURRENT)
+  tfstate2inventory.apply_changes(emptied, currenttable, {}, ['web-3'])
+  assert 'cache' not in emptied['all']['children']
+
+def wait_in_thread(watcher):
+  thread = threading.Thread(target=watcher.wait, daemon=True)
+  thread.start()
+  return thread
+
+def check_watcher(watcher, statefile):
+  # Rewriting the state file in place and replacing it are both noticed, and wait returns once per change.
+  thread = wait_in_thread(watcher)
+  with open(statefile, 'w') as statefd:
+    statefd.write('{"serial": 2, "resources": []}')
+  thread.join(5)
+  assert not thread.is_alive()
+
+  thread = wait_in_thread(watcher)
+  replacement = statefile+'.new'
+  with open(replacement, 'w') as statefd:
+    statefd.write('{"serial": 3}')
+  os.replace(replacement, statefile)
+  thread.join(5)
+  assert not thread.is_alive()
+
+  # A file written next to the state file is not a change of the state file.
+  thread = wait_in_thread(watcher)
+  with open(statefile+'.backup', 'w') as statefd:
+    statefd.write('{}')
+  thread.join(0.5)
+  assert thread.is_alive()
+
+def test_state_watcher(tmp_path):
+  statefile = str(tmp_path / 'terraform.tfstate')
+  with open(statefile, 'w') as statefd:
+    statefd.write('{"serial": 1}')
+  watcher = tfstate2inventory.StateWatcher(statefile, 0.1)
+  check_watcher(watcher, statefile)
+
+def test_state_watcher_without_inotify(tmp_path):
+  statefile = str(tmp_path / 'terraform.tfstate')
+  with open(statefile, 'w') as statefd:
+    statefd.write('{"serial": 1}')
+  watcher = tfstate2inventory.StateWatcher(statefile, 0.1)
+  if watcher.inotifyfd is not None:
+    os.close(watcher.inotifyfd)
+    watcher.inotifyfd = None
+  check_watcher(watcher, statefile)
@@ -11,6 +11,7 @@
 #   1. using only root module resources.
 #   2. using only child module resources.
 #   3. using both root and child module resources.
+#   4. using resources of nested child modules, at any depth.
 #
 # - Supports both fixed and floating ips for inventory file. Depending on the index given the corresponding NIC is used.
 #   For example, if 'fixed 1' is given as input, then the IPs assigned to the eth1 NIC are used in the inventory. If eth1 does not exist, then the eth0 is used.
@@ -22,276 +23,1314 @@
 #
 # - Supports setting variable [ansible_python_interpreter] into inventory file for ansible
 #
-# - Requires terraform v0.12.x. Supports only terraform state files of version 4.
+# - Reads terraform state files of version 4 natively, without running terraform. The output of 'terraform show -json'
+#   (requires terraform v0.12.x) can still be used instead, by giving the '--terraform-show' option.
+# - Supports reading large state files incrementally with the '--stream' option, keeping only compute instance and floating ip
+#   resources in memory.
+#
+# - Can be used as an ansible dynamic inventory script ('--list' and '--host <host>'). Generated inventories are cached on disk
+#   and reused while the lineage and serial of the state file stay the same.
+#
+# - Supports merging many state files (paths, URLs or glob patterns) into one inventory. The state files are processed in
+#   parallel by a pool of worker processes.
+#
+# - Supports watching a state file or URL with the '--watch' option, and updating the inventory whenever the state changes.
+#   The current inventory can also be served over HTTP to other ansible controllers with '--serve'.
+#
+# - Can be imported as a library: parse_state() yields compact host records of a state, build_inventory() builds the
+#   inventory of the records, and a Profile reports the timings of the phases and the counts of what was processed.
 #
 import json
 import yaml
 import subprocess
 import os
+import re
 import getopt
 import sys
+import time
+import shlex
+import collections
+import contextlib
+import hashlib
+import tempfile
+import io
+import gzip
+import glob
+import shutil
+import threading
+import select
+import ctypes,ctypes.util
+import http.client
+import http.server
+import concurrent.futures
 import urllib.request,urllib.parse
-from urllib.error import HTTPError,URLError,ContentTooShortError
-from socket import gethostbyname,gaierror
-
-urlelement = []
-tfresourceslist = []
-allcomputeresourcesattr = []
-allfloatingresourcesattr = []
-iptype = 'floating'
-
-if len(sys.argv) == 1:
-  sys.stderr.write('Error[700] ::: Usage: tfstate2inventory.py [mandatory:<url>|<file>] [optional:floating|fixed] [optional:<nic index>] [optional:ip|associate]\nFirst argument is the path or the URL to terraforma state file. Second, optional argument is the word "floating" or "fixed" that defines which IP address is going to be used to generate inventory. Third optional argument is the index of the NIC that is going to be used for remote communication by ansible (in case of multiple networks attached to a host). Defaults to 0 which is the first NIC of the host. Forth optional argument is the type of the floating ip used. Floating IPs can be derived from the floatingip module of terraform when floating IPs are created dynamically through the build process, or from the floatingip_associate module, when floating IPs already exist into the project and are associated with dynamically create ports of the project. Defaults to ip, assuming that floating IPs are created by the build process.\n')
-  sys.exit(700)
-elif len(sys.argv) == 5:
-  if sys.argv[2] != 'floating' and sys.argv[2] != 'fixed':
-    sys.stderr.write('Error[701] ::: Usage: tfstate2inventory.py [mandatory:<url>|<file>] [optional:floating|fixed] [optional:<nic index>] [optional:ip|associate]\nSecond argument must be one of [floating|fixed]. Third the index of the NIC that is going to be used for remote communication. Usually a number between 0-2.\nForth argument must be one of [ip|associate].\n')
-    sys.exit(701)
-  else:
-    TERRAFORMSTATELOCATION = sys.argv[1]
-    iptype = sys.argv[2]
-    nic = sys.argv[3]
-    if sys.argv[4] == 'ip':
-      floating_module = 'openstack_networking_floatingip_v2'
-    elif sys.argv[4] == 'associate':
-      floating_module = 'openstack_networking_floatingip_associate_v2'
+from socket import gaierror
+
+connections = threading.local()
+
+USAGE = 'Usage: tfstate2inventory.py [optional:--terraform-show|--stream] [optional:--list|--host <host>] [optional:--refresh|--no-cache] [optional:--cache-ttl <seconds>] [optional:--cache-dir <dir>] [optional:--jobs <count>] [optional:--group-prefix] [optional:--format yaml|json|ini] [optional:--watch] [optional:--interval <seconds>] [optional:--serve [<address>:]<port>] [mandatory:<url>|<file>|<glob> ...] [optional:floating|fixed] [optional:<nic index>] [optional:ip|associate]'
+
+class InventoryError(Exception):
+  # Error while generating the inventory of a state file, reported as 'Error[code] ::: message'.
+  def __init__(self, code, message):
+    Exception.__init__(self, code, message)
+    self.code = code
+    self.message = message
+
+class Options(object):
+  # Settings of a run of the script, as given on the command line: the ip type, NIC and floating ip resource type
+  # of the hosts, the reader of the state files, the mode and format of the output, the cache, the number of worker
+  # processes of the batch mode and the watch mode. Every setting defaults to the one of the script, so only the
+  # ones that differ are given, e.g. Options(iptype='fixed', usecache=False). Options are handed as they are to the
+  # worker processes of the batch mode.
+  def __init__(self, **settings):
+    self.iptype = 'floating'
+    self.nic = 0
+    self.floating_module = 'openstack_networking_floatingip_v2'
+    self.reader = 'native'
+    self.listing = False
+    self.hostname = None
+    self.groupprefix = False
+    self.outputformat = 'yaml'
+    self.jobs = os.cpu_count() or 1
+    self.usecache = True
+    self.refresh = False
+    self.cachettl = 3600
+    self.cachedir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'tfstate2inventory')
+    self.watching = False
+    self.interval = 5.0
+    self.serveaddress = None
+    for setting, value in settings.items():
+      if setting not in self.__dict__:
+        raise TypeError('unknown option '+setting)
+      setattr(self, setting, value)
+
+# Floating ip resource types and the attribute holding the floating ip of each one.
+FLOATING_MODULES = {
+  'openstack_networking_floatingip_v2': 'address',
+  'openstack_networking_floatingip_associate_v2': 'floating_ip',
+}
+
+# Connection variables of a host that are read from the metadata of its compute instance, in inventory order.
+HOST_VARIABLES = ('ansible_port', 'ansible_user', 'ansible_ssh_private_key_file', 'ansible_python_interpreter')
+
+# Record of a compute instance, with the attributes used in the inventory: name, id, primary group, extra groups,
+# fixed ip and port id of the selected NIC, its floating ip (or None), the address used by ansible, and the
+# connection variables (None when not set).
+HostRecord = collections.namedtuple('HostRecord', ('name', 'id', 'group', 'extra_groups', 'fixed_ip', 'port', 'floating_ip', 'ansible_host') + HOST_VARIABLES)
+
+# Attributes of the resources read by the streaming reader, the ones used by the inventory. Other attributes
+# are dropped as soon as each instance is decoded.
+STREAM_ATTRIBUTES = {
+  'openstack_compute_instance_v2': ('id', 'name', 'metadata', 'network'),
+  'openstack_networking_floatingip_v2': ('address', 'fixed_ip', 'port_id'),
+  'openstack_networking_floatingip_associate_v2': ('floating_ip', 'fixed_ip', 'port_id'),
+}
+
+# Metadata and NIC attributes of compute instances read by the streaming reader.
+STREAM_METADATA = ('cluster', 'ansible_extra_groups') + HOST_VARIABLES
+STREAM_NETWORK = ('fixed_ip_v4', 'port')
+
+# Readers of state files: natively, incrementally (--stream) or through 'terraform show -json' (--terraform-show).
+READERS = ('native', 'stream', 'show')
+
+# Connection variables that are moved into the vars of a group when all hosts of the group share them.
+HOISTED_VARIABLES = ('ansible_user', 'ansible_port', 'ansible_ssh_private_key_file', 'ansible_python_interpreter')
+
+# The libyaml based dumper is much faster than the pure python one, when pyyaml is built with it.
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+OUTPUT_FORMATS = ('yaml', 'json', 'ini')
+
+# inotify events on the directory of a watched state file: the file was written and closed, moved into place or created.
+INOTIFY_EVENTS = 0x8 | 0x80 | 0x100
+
+# Seconds to wait for a server to connect or to send data, before a request of a remote state file fails. Without a
+# timeout, a server that stops answering would block the script, and the watch mode, forever.
+HTTP_TIMEOUT = 60
+
+# Version of the layout of cached inventories. Entries written with another layout are not reused.
+CACHE_FORMAT = 2
+
+def module_path(module):
+  # Split a module address like 'module.a[0].module.b' into the addresses of the module and all of its parents.
+  steps = re.findall(r'module\.[^.\[]+(?:\[[^\]]*\])?', module)
+  return ['.'.join(steps[:depth]) for depth in range(1, len(steps) + 1)]
+
+def provider_name(provider):
+  # Provider name of a resource in 'terraform show -json', from the provider address of the resource in the state
+  # file: the source address for 'provider["registry.terraform.io/hashicorp/openstack"]' (terraform 0.13 and later),
+  # the type and alias for 'provider.openstack.east' (terraform 0.12). The module of the provider is left out.
+  provider = re.sub(r'^(module\.[^.\[]+(\[[^\]]*\])?\.)+', '', provider or '')
+  quoted = re.match(r'provider\["([^"]*)"\]', provider)
+  if quoted:
+    return quoted.group(1)
+  if provider.startswith('provider.'):
+    return provider[len('provider.'):]
+  return provider
+
+def state_values(resources, outputs=None):
+  # Arrange the resources and outputs of a version 4 state file into the 'values' document printed by
+  # 'terraform show -json'. Resources and child modules are sorted by address. A deposed object follows the
+  # current object of its instance, with the same address and its 'deposed_key'.
+  modules = {'': {}}
+  for resource in resources:
+    if resource.get('mode') == 'data':
+      prefix = 'data.'+resource['type']+'.'+resource['name']
     else:
-      sys.stderr.write('Error[702] ::: Usage: tfstate2inventory.py [mandatory:<url>|<file>] [optional:floating|fixed] [optional:<nic index>] [optional:ip|associate]\nSecond argument must be one of [floating|fixed]. Third the index of the NIC that is going to be used for remote communication. Usually a number between 0-2.\nForth argument must be one of [ip|associate].\n')
-      sys.exit(702)
-elif len(sys.argv) == 4:
-  if sys.argv[2] != 'floating' and sys.argv[2] != 'fixed':
-    sys.stderr.write('Error[703] ::: Usage: tfstate2inventory.py [mandatory:<url>|<file>] [optional:floating|fixed] [optional:<nic index>] [optional:ip|associate]\nSecond argument must be one of [floating|fixed]. Third the index of the NIC that is going to be used for remote communication. Usually a number between 0-2.\nForth argument must be one of [ip|associate].\n')
-    sys.exit(703)
-  else:
-    TERRAFORMSTATELOCATION = sys.argv[1]
-    iptype = sys.argv[2]
-    nic = sys.argv[3]
-    floating_module = 'openstack_networking_floatingip_v2'
-elif len(sys.argv) == 3:
-  if sys.argv[2] != 'floating' and sys.argv[2] != 'fixed':
-    sys.stderr.write('Error[704] ::: Usage: tfstate2inventory.py [mandatory:<url>|<file>] [optional:floating|fixed] [optional:<nic index>] [optional:ip|associate]\nSecond argument must be one of [floating|fixed]. Third the index of the NIC that is going to be used for remote communication. Usually a number between 0-2.\nForth argument must be one of [ip|associate].\n')
-    sys.exit(704)
-  else:
-    TERRAFORMSTATELOCATION = sys.argv[1]
-    iptype = sys.argv[2]
-    nic = 0
-    floating_module = 'openstack_networking_floatingip_v2'
-elif len(sys.argv) == 2:
-  TERRAFORMSTATELOCATION = sys.argv[1]
-  iptype = 'floating'
-  nic = 0
-  floating_module = 'openstack_networking_floatingip_v2'
-else:
-  sys.stderr.write('Error[706] ::: Usage: tfstate2inventory.py [mandatory:<url>|<file>] [optional:floating|fixed] [optional:<nic index>] [optional:ip|associate]\nSecond argument must be one of [floating|fixed]. Third the index of the NIC that is going to be used for remote communication. Usually a number between 0-2.\nForth argument must be one of [ip|associate].\n')
-  sys.exit(706)
-
-if TERRAFORMSTATELOCATION.startswith('http://') or TERRAFORMSTATELOCATION.startswith('https://'):
-  urlelement = urllib.parse.urlparse(TERRAFORMSTATELOCATION)
-  hostname = urlelement[1].split(':')
+      prefix = resource['type']+'.'+resource['name']
+    if resource.get('module'):
+      parents = module_path(resource['module'])
+      for parent in parents:
+        if parent not in modules:
+          modules[parent] = {'address': parent}
+      prefix = parents[-1]+'.'+prefix
+      module = modules[parents[-1]]
+    else:
+      module = modules['']
+    for instance in resource.get('instances', []):
+      showresource = {}
+      if 'index_key' in instance:
+        showresource['address'] = prefix+'['+json.dumps(instance['index_key'])+']'
+      else:
+        showresource['address'] = prefix
+      showresource['mode'] = resource.get('mode', 'managed')
+      showresource['type'] = resource['type']
+      showresource['name'] = resource['name']
+      if 'index_key' in instance:
+        showresource['index'] = instance['index_key']
+      showresource['provider_name'] = provider_name(resource.get('provider'))
+      showresource['schema_version'] = instance.get('schema_version', 0)
+      showresource['values'] = instance.get('attributes', {})
+      if instance.get('dependencies'):
+        showresource['depends_on'] = instance['dependencies']
+      if instance.get('status') == 'tainted':
+        showresource['tainted'] = True
+      if 'deposed' in instance:
+        showresource['deposed_key'] = instance['deposed']
+      module.setdefault('resources', []).append(showresource)
+  for address in sorted(modules, key=len, reverse=True):
+    module = modules[address]
+    if 'resources' in module:
+      module['resources'].sort(key=lambda showresource: (showresource['address'], 'deposed_key' in showresource, showresource.get('deposed_key', '')))
+    if 'child_modules' in module:
+      module['child_modules'].sort(key=lambda child: child['address'])
+    if address:
+      parents = module_path(address)
+      parent = parents[-2] if len(parents) > 1 else ''
+      modules[parent].setdefault('child_modules', []).append(module)
+  values = {}
+  if outputs:
+    values['outputs'] = dict((name, {'sensitive': bool(output.get('sensitive')), 'value': output.get('value')}) for name, output in outputs.items())
+  values['root_module'] = modules['']
+  return values
+
+class StateStream(object):
+  # Incremental reader over the JSON text of a terraform state file. Values are scanned chunk by chunk and
+  # are only decoded when asked for, so skipped values never have to be held in memory as a whole.
+  CHUNK = 65536
+  WHITESPACE = re.compile(r'[ \t\n\r]*')
+  TOKEN = re.compile(r'[{}\[\]"]')
+  STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.S)
+  SCALAR = re.compile(r'[^,:\]}\s]*')
+  DECODER = json.JSONDecoder()
+
+  def __init__(self, statefd):
+    self.statefd = statefd
+    self.buffer = ''
+    self.pos = 0
+
+  def _read(self, keep):
+    # Drop the buffer before position keep and append the next chunk. Returns False at the end of the file.
+    # Callers drop all that they have scanned, so only a short unscanned tail is copied along with the chunk.
+    chunk = self.statefd.read(self.CHUNK)
+    self.buffer = self.buffer[keep:] + chunk
+    self.pos -= keep
+    return bool(chunk)
+
+  def _peek(self):
+    while True:
+      self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+      if self.pos < len(self.buffer):
+        return self.buffer[self.pos]
+      if not self._read(self.pos):
+        return ''
+
+  def _expect(self, chars):
+    char = self._peek()
+    if not char or char not in chars:
+      raise ValueError('Expecting one of '+repr(chars)+' at character '+str(self.pos)+' of the buffered state')
+    self.pos += 1
+    return char
+
+  def value(self, keep=True):
+    # Scan the next value and return it decoded, or skip over it when keep is False.
+    char = self._peek()
+    start = self.pos
+    if keep and char in '{["':
+      # Most values to decode fit in the buffer. Decode them at once, and scan only those that do not.
+      try:
+        decoded, self.pos = self.DECODER.raw_decode(self.buffer, start)
+        return decoded
+      except ValueError:
+        pass
+    # Scanned parts of a value to decode that spans several chunks, joined once the whole value is scanned.
+    parts = []
+    if char in '{[':
+      depth = 0
+      index = start
+      while True:
+        match = self.TOKEN.search(self.buffer, index)
+        if match is None:
+          index = len(self.buffer)
+        elif match.group() == '"':
+          string = self.STRING.match(self.buffer, match.start())
+          if string is not None:
+            index = string.end()
+            continue
+          index = match.start()
+        else:
+          index = match.end()
+          depth += 1 if match.group() in '{[' else -1
+          if depth == 0:
+            break
+          continue
+        # The value continues in the next chunk. Set the scanned part aside when decoding, and keep only the
+        # unscanned part in the buffer, so that the buffer does not grow with the value.
+        if keep:
+          parts.append(self.buffer[start:index])
+        if not self._read(index):
+          raise ValueError('Unexpected end of terraform state')
+        start = 0
+        index = 0
+    elif char == '"':
+      while True:
+        match = self.STRING.match(self.buffer, start)
+        if match is not None:
+          break
+        if not self._read(start):
+          raise ValueError('Unexpected end of terraform state')
+        start = self.pos
+      index = match.end()
+    else:
+      while True:
+        index = self.SCALAR.match(self.buffer, start).end()
+        if index < len(self.buffer) or not self._read(start):
+          break
+        start = self.pos
+    self.pos = index
+    if keep:
+      parts.append(self.buffer[start:index])
+      return json.loads(''.join(parts))
+
+  def members(self):
+    # Iterate over the keys of the object at the current position. Each value must be read with value() or
+    # walked into before the next key is asked for.
+    self._expect('{')
+    if self._peek() == '}':
+      self.pos += 1
+      return
+    while True:
+      key = self.value()
+      self._expect(':')
+      yield key
+      if self._expect(',}') == '}':
+        return
+
+  def elements(self):
+    # Iterate over the elements of the array at the current position, in the same way as members().
+    self._expect('[')
+    if self._peek() == ']':
+      self.pos += 1
+      return
+    while True:
+      yield
+      if self._expect(',]') == ']':
+        return
+
+def stream_attributes(resourcetype, attributes):
+  # Keep only the attributes of an instance that the inventory uses. The kept dicts share their keys,
+  # instead of holding the copies decoded for every instance.
+  if not isinstance(attributes, dict):
+    return attributes
+  kept = dict((attribute, attributes[attribute]) for attribute in STREAM_ATTRIBUTES[resourcetype] if attribute in attributes)
+  if isinstance(kept.get('metadata'), dict):
+    kept['metadata'] = dict((variable, kept['metadata'][variable]) for variable in STREAM_METADATA if variable in kept['metadata'])
+  if isinstance(kept.get('network'), list):
+    kept['network'] = [dict((attribute, network[attribute]) for attribute in STREAM_NETWORK if attribute in network) if isinstance(network, dict) else network for network in kept['network']]
+  return kept
+
+def stream_instances(stream, resourcetype):
+  # Read the instances of a resource one at a time, keeping only the attributes that the inventory uses.
+  instances = []
+  for element in stream.elements():
+    decoded = stream.value()
+    if not isinstance(decoded, dict):
+      raise ValueError('Expecting an object for every instance of a '+resourcetype+' resource')
+    instance = {}
+    for instancekey in ('index_key', 'deposed', 'schema_version'):
+      if instancekey in decoded:
+        instance[instancekey] = decoded[instancekey]
+    if 'attributes' in decoded:
+      instance['attributes'] = stream_attributes(resourcetype, decoded['attributes'])
+    instances.append(instance)
+  return instances
+
+def stream_resources(statefd, statefile, resourcetypes):
+  # Yield the resources of the given types from a version 4 state file as they are read. The instances of
+  # all other resources are skipped without being decoded, the instances of the given types are decoded
+  # one at a time.
+  stream = StateStream(statefd)
+  for key in stream.members():
+    if key == 'version':
+      if stream.value() != 4:
+        raise InventoryError(714, 'Input file ['+statefile+'] is not a terraform state file of version 4. Use the --terraform-show option to read it through terraform.')
+    elif key == 'resources':
+      for element in stream.elements():
+        resource = {}
+        for resourcekey in stream.members():
+          if resourcekey == 'instances' and 'type' in resource and resource['type'] not in resourcetypes:
+            stream.value(keep=False)
+          elif resourcekey == 'instances' and resource.get('type') in resourcetypes:
+            resource['instances'] = stream_instances(stream, resource['type'])
+          else:
+            resource[resourcekey] = stream.value()
+        if resource.get('type') in resourcetypes:
+          yield resource
+    else:
+      stream.value(keep=False)
+
+def stream_state(statefd, statefile, profile=None):
+  # Read only the compute instance and floating ip resources of a version 4 state file, incrementally.
+  # The file is read while it is decoded, so the decode phase includes reading it.
+  profile = profile or Profile()
+  resourcetypes = set(STREAM_ATTRIBUTES)
+  try:
+    with profile.phase('decode'):
+      resources = list(stream_resources(statefd, statefile, resourcetypes))
+  except ValueError as jsonerr:
+    raise InventoryError(713, 'Input file ['+statefile+'] is not a valid terraform state file. Reason: '+str(jsonerr))
+  with profile.phase('arrange'):
+    values = state_values(resources)
+  return {'format_version': '0.1', 'values': values}
+
+def read_state(statefd, statefile, profile=None):
+  # Read a terraform state file of version 4 without running terraform.
+  profile = profile or Profile()
   try:
-    gethostbyname(hostname[0])
-  except gaierror as se:
-    sys.stderr.write('Error[707] ::: Could not resolve hostname ['+hostname[0]+']. Please check for typos or dns resolving issues. Reason: '+se.strerror+'\n')
-    sys.exit(707)
+    statetext = statefd.read()
+    with profile.phase('decode'):
+      rawstate = json.loads(statetext)
+  except ValueError as jsonerr:
+    raise InventoryError(713, 'Input file ['+statefile+'] is not a valid terraform state file. Reason: '+str(jsonerr))
+  del statetext
+  if not isinstance(rawstate, dict) or rawstate.get('version') != 4:
+    raise InventoryError(714, 'Input file ['+statefile+'] is not a terraform state file of version 4. Use the --terraform-show option to read it through terraform.')
+  with profile.phase('arrange'):
+    values = state_values(rawstate.get('resources', []), rawstate.get('outputs'))
+  return {'format_version': '0.1', 'terraform_version': rawstate.get('terraform_version'), 'values': values}
+
+def show_state(statefile):
+  # Read a terraform state file through 'terraform show -json'.
   try:
-    urllib.request.urlretrieve(TERRAFORMSTATELOCATION, 'terraform.tfstate')
-  except (URLError,HTTPError,ContentTooShortError) as urle:
-    sys.stderr.write('Error[708] ::: Error during retrieval of remote terraform state file from ['+TERRAFORMSTATELOCATION+']. Reason: '+urle.reason+'\n')
-    sys.exit(708)
-  TERRAFORMSTATEFILE = 'terraform.tfstate'
-else:
-  TERRAFORMSTATEFILE = TERRAFORMSTATELOCATION
-
-if os.path.exists(TERRAFORMSTATEFILE) and os.access(TERRAFORMSTATEFILE, os.R_OK):
+    tfstatejson = subprocess.Popen(["terraform","show","-json",statefile], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  except (OSError, subprocess.CalledProcessError) as sperr:
+    raise InventoryError(709, 'Error when executing terraform command.\n'+str(sperr))
+  cmdout,cmderr = tfstatejson.communicate()
+  cmdrc = tfstatejson.returncode
+  if cmdrc != 0:
+    raise InventoryError(711, 'Error when executing terraform command.\n'+cmdout.decode('ascii')+cmderr.decode('ascii'))
+  return json.loads(cmdout)
+
+def state_header(statefile):
+  # Read the version, lineage and serial of a version 4 state file, stopping before its resources.
+  # Returns None when the file is not a version 4 state file.
+  header = {}
   try:
-    tfstatejson = subprocess.Popen(["terraform","show","-json",TERRAFORMSTATEFILE], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-  except subprocess.CalledProcessError as sperr:
-    sys.stderr.write('Error[709] ::: Error when executing terraform command.\n'+sperr.output+'\n')
-    sys.exit(709)
-else:
-  sys.stderr.write('Error[710] ::: Input file ['+TERRAFORMSTATEFILE+'] could not be found or read.\n')
-  sys.exit(710)
-
-cmdout,cmderr = tfstatejson.communicate()
-cmdrc = tfstatejson.returncode
-if cmdrc != 0:
-  sys.stderr.write('Error[711] ::: Error when executing terraform command.\n'+cmdout.decode('ascii')+cmderr.decode('ascii')+'\n')
-  sys.exit(711)
-
-terraformstate = json.loads(cmdout)
-
-# Populate list of recourses with the resources created in the root module.
-try:
-  for resource_index in range(len(terraformstate['values']['root_module']['resources'])):
+    with open(statefile, 'r') as statefd:
+      stream = StateStream(statefd)
+      for key in stream.members():
+        if key in ('version', 'lineage', 'serial'):
+          header[key] = stream.value()
+          if len(header) == 3:
+            break
+        elif key == 'resources':
+          break
+        else:
+          stream.value(keep=False)
+  except (OSError, ValueError):
+    return None
+  if header.get('version') != 4 or 'lineage' not in header or 'serial' not in header:
+    return None
+  return header
+
+def load_state(statefd, statefile, reader, profile=None):
+  # Read an open terraform state file with the given reader, one of READERS.
+  if reader == 'show':
+    # terraform show needs a file of its own. Use a private temporary one, so that concurrent runs do not interfere.
+    tmpfd, tmpstatefile = tempfile.mkstemp(suffix='.tfstate')
     try:
-      if 'openstack_compute_instance_v2' in terraformstate['values']['root_module']['resources'][resource_index]['address']:
-        computeresourceattr = {}
-        computeresourceattr['id'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['id']
-        computeresourceattr['metadata_cluster'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']['cluster']
-        if 'ansible_extra_groups' in terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata'] and terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']['ansible_extra_groups']:
-          computeresourceattr['metadata_ansible_extra_groups'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']['ansible_extra_groups']
-        if 'ansible_port' in terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']:
-          computeresourceattr['metadata_ansible_port'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']['ansible_port']
-        if 'ansible_user' in terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']:
-          computeresourceattr['metadata_ansible_user'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']['ansible_user']
-        if 'ansible_ssh_private_key_file' in terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']:
-          computeresourceattr['metadata_ansible_ssh_private_key_file'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']['ansible_ssh_private_key_file']
-        if 'ansible_python_interpreter' in terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']:
-          computeresourceattr['metadata_ansible_python_interpreter'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['metadata']['ansible_python_interpreter']
-        computeresourceattr['name'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['name']
-        try:
-          computeresourceattr['network.0.fixed_ip_v4'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['network'][int(nic)]['fixed_ip_v4']
-        except IndexError:
-          sys.stderr.write('INFO ::: NIC with index '+nic+' does not exist on host with id '+computeresourceattr['id']+'. Auto revert index to 0..\n')
-          computeresourceattr['network.0.fixed_ip_v4'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['network'][0]['fixed_ip_v4']
-        allcomputeresourcesattr.append(computeresourceattr)
-      elif floating_module in terraformstate['values']['root_module']['resources'][resource_index]['address']:
-        floatingresourceattr = {}
-        floatingresourceattr['fixed_ip'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['fixed_ip']
-        if floating_module == 'openstack_networking_floatingip_associate_v2':
-          floatingresourceattr['floating_ip'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['floating_ip']
-        elif floating_module == 'openstack_networking_floatingip_v2':
-          floatingresourceattr['floating_ip'] = terraformstate['values']['root_module']['resources'][resource_index]['values']['address']
-        allfloatingresourcesattr.append(floatingresourceattr)
-    except KeyError:
-      sys.stderr.write('INFO ::: Root module with no data found.\n')
-except KeyError:
-  sys.stderr.write('INFO ::: No root module resources found.\n')
+      with os.fdopen(tmpfd, 'w') as tmpfile:
+        shutil.copyfileobj(statefd, tmpfile)
+      return show_state(tmpstatefile)
+    finally:
+      os.unlink(tmpstatefile)
+  elif reader == 'stream':
+    return stream_state(statefd, statefile, profile)
+  return read_state(statefd, statefile, profile)
+
+def connection_pool():
+  # Kept-alive connections of the current thread, by url scheme and host.
+  if not hasattr(connections, 'pool'):
+    connections.pool = {}
+  return connections.pool
+
+def http_connection(scheme, netloc):
+  # Return the connection to the host of a url, reusing the kept-alive connection of an earlier request to the
+  # same host. The second value tells whether the connection goes through a plain http proxy.
+  pool = connection_pool()
+  if (scheme, netloc) not in pool:
+    url = urllib.parse.urlsplit(scheme+'://'+netloc)
+    port = url.port or (443 if scheme == 'https' else 80)
+    proxy = urllib.request.getproxies().get(scheme)
+    if proxy and urllib.request.proxy_bypass(url.hostname):
+      proxy = None
+    if proxy:
+      proxyurl = urllib.parse.urlsplit(proxy if '://' in proxy else 'http://'+proxy)
+      if scheme == 'https':
+        connection = http.client.HTTPSConnection(proxyurl.hostname, proxyurl.port or 3128, timeout=HTTP_TIMEOUT)
+        connection.set_tunnel(url.hostname, port)
+      else:
+        connection = http.client.HTTPConnection(proxyurl.hostname, proxyurl.port or 3128, timeout=HTTP_TIMEOUT)
+    elif scheme == 'https':
+      connection = http.client.HTTPSConnection(url.hostname, port, timeout=HTTP_TIMEOUT)
+    else:
+      connection = http.client.HTTPConnection(url.hostname, port, timeout=HTTP_TIMEOUT)
+    pool[(scheme, netloc)] = (connection, bool(proxy) and scheme == 'http')
+  return pool[(scheme, netloc)]
+
+def fetch_state(location, validator):
+  # Request a remote state file. The validators of the cached inventory are sent along, so that an unchanged
+  # state is answered with '304 Not Modified', in which case None is returned instead of the response.
+  headers = {'Accept-Encoding': 'gzip'}
+  if validator and validator.get('etag'):
+    headers['If-None-Match'] = validator['etag']
+  if validator and validator.get('last_modified'):
+    headers['If-Modified-Since'] = validator['last_modified']
+  for redirect in range(6):
+    url = urllib.parse.urlsplit(location)
+    for attempt in range(2):
+      connection, proxied = http_connection(url.scheme, url.netloc)
+      target = location if proxied else urllib.parse.urlunsplit(('', '', url.path or '/', url.query, ''))
+      try:
+        connection.request('GET', target, headers=headers)
+        response = connection.getresponse()
+        break
+      except gaierror as se:
+        raise InventoryError(707, 'Could not resolve hostname ['+str(url.hostname)+']. Please check for typos or dns resolving issues. Reason: '+se.strerror)
+      except (http.client.HTTPException, OSError) as httperr:
+        # A kept-alive connection may have been closed by the server in the meantime. Retry once on a new one.
+        connection.close()
+        del connection_pool()[(url.scheme, url.netloc)]
+        if attempt:
+          raise InventoryError(708, 'Error during retrieval of remote terraform state file from ['+location+']. Reason: '+str(httperr))
+    if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+      response.read()
+      location = urllib.parse.urljoin(location, response.getheader('Location'))
+    elif response.status == 304:
+      response.read()
+      return None
+    elif response.status != 200:
+      response.read()
+      raise InventoryError(708, 'Error during retrieval of remote terraform state file from ['+location+']. Reason: '+str(response.status)+' '+response.reason)
+    else:
+      return response
+  raise InventoryError(708, 'Error during retrieval of remote terraform state file from ['+location+']. Reason: Too many redirects')
+
+def response_validator(response):
+  # The validators of a response, to be sent with the next request of the same state file.
+  validator = {}
+  if response.getheader('ETag'):
+    validator['etag'] = response.getheader('ETag')
+  if response.getheader('Last-Modified'):
+    validator['last_modified'] = response.getheader('Last-Modified')
+  return validator or None
+
+def response_stream(response):
+  # Text stream over the body of a response, decompressing a gzip encoded body on the fly.
+  if (response.getheader('Content-Encoding') or '').lower() == 'gzip':
+    return io.TextIOWrapper(gzip.GzipFile(fileobj=response), encoding='utf-8')
+  return io.TextIOWrapper(response, encoding='utf-8')
+
+def cache_path(location, options):
+  # Path of the cache file for the inventory generated from a state location with the given options.
+  cachekey = json.dumps([CACHE_FORMAT, location, options.iptype, str(options.nic), options.floating_module, options.reader == 'show'])
+  return os.path.join(options.cachedir, hashlib.sha256(cachekey.encode('utf-8')).hexdigest()+'.json')
+
+def read_cache(location, options):
+  # Return the cache entry of a state location, if there is one.
+  try:
+    with open(cache_path(location, options), 'r') as cachefd:
+      return json.load(cachefd)
+  except (OSError, ValueError):
+    return None
+
+def load_cache(location, validator, options):
+  # Return the cached inventory of a state location, if it was generated from the same state within the cache ttl.
+  cacheentry = read_cache(location, options)
+  if cacheentry is None or cacheentry.get('validator') != validator or time.time() - cacheentry.get('time', 0) > options.cachettl:
+    return None
+  return cacheentry.get('inventory')
+
+def save_cache(location, validator, inventory, options):
+  # Store the inventory of a state location in the cache. The cache file is replaced atomically,
+  # so concurrent runs never read a partially written entry.
+  try:
+    os.makedirs(options.cachedir, exist_ok=True)
+    cachefd, cachetmp = tempfile.mkstemp(dir=options.cachedir, suffix='.tmp')
+    with os.fdopen(cachefd, 'w') as cachefile:
+      json.dump({'validator': validator, 'time': time.time(), 'inventory': inventory}, cachefile)
+    os.replace(cachetmp, cache_path(location, options))
+  except OSError as oserr:
+    sys.stderr.write('INFO ::: Could not write inventory cache into ['+options.cachedir+']. Reason: '+str(oserr)+'\n')
+
+def inventory_list(inventory):
+  # Convert the inventory into the document printed by an ansible dynamic inventory script for --list.
+  dynamic = {'_meta': {'hostvars': {}}, 'all': {'children': []}}
+  for group in inventory['all']['children']:
+    dynamic['all']['children'].append(group)
+    dynamic[group] = {'hosts': []}
+    for name, hostvars in inventory['all']['children'][group]['hosts'].items():
+      dynamic[group]['hosts'].append(name)
+      dynamic['_meta']['hostvars'].setdefault(name, {}).update(hostvars or {})
+    if inventory['all']['children'][group].get('vars'):
+      dynamic[group]['vars'] = inventory['all']['children'][group]['vars']
+  return dynamic
 
-# Populate list of recourses with the resources created in child modules.
-try:
-  for resource_index in range(len(terraformstate['values']['root_module']['child_modules'])):
+class Profile(object):
+  # Timings of the phases of parsing a state and building its inventory, and counts of what was processed: the
+  # resources read, the hosts emitted, the hosts whose NIC fell back to NIC 0, the hosts without a floating ip and
+  # the groups built. Give an instance to parse_state and build_inventory to collect them. The hook, if given, is
+  # called with the name and the seconds of every phase as soon as it ends.
+  # Phases can be nested: 'decode' and 'arrange' are parts of 'read', and when build_inventory consumes the records
+  # of parse_state as they are parsed, the 'hosts' phase is a part of 'build'.
+  def __init__(self, hook=None):
+    self.hook = hook
+    self.timings = {}
+    self.counts = {'resources': 0, 'hosts': 0, 'nic_fallbacks': 0, 'floating_missing': 0, 'groups': 0}
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    # Time the block of a phase. A phase that fails is recorded too, up to the error.
+    start = time.perf_counter()
+    try:
+      yield self
+    finally:
+      self.record(name, time.perf_counter() - start)
+
+  def record(self, name, seconds):
+    self.timings[name] = self.timings.get(name, 0) + seconds
+    if self.hook is not None:
+      self.hook(name, seconds)
+
+  def count(self, name, amount=1):
+    self.counts[name] = self.counts.get(name, 0) + amount
+
+def read_source(source, reader, profile):
+  # Read a state into the 'terraform show -json' layout. The source is the path or the http(s) URL of a state file,
+  # an open state file, or an already decoded state document (a state file of version 4 or 'terraform show -json').
+  if isinstance(source, dict):
+    if 'values' in source:
+      return source
+    if source.get('version') != 4:
+      raise InventoryError(714, 'State document is not a terraform state of version 4.')
+    with profile.phase('arrange'):
+      values = state_values(source.get('resources', []), source.get('outputs'))
+    return {'format_version': '0.1', 'terraform_version': source.get('terraform_version'), 'values': values}
+  if not isinstance(source, str):
+    return load_state(source, getattr(source, 'name', '<stream>'), reader, profile)
+  if source.startswith('http://') or source.startswith('https://'):
+    response = fetch_state(source, None)
+    terraformstate = load_state(response_stream(response), source, reader, profile)
+    # Read what is left of the body, so that the connection can be used for the next request.
+    response.read()
+    return terraformstate
+  if not (os.path.exists(source) and os.access(source, os.R_OK)):
+    raise InventoryError(710, 'Input file ['+source+'] could not be found or read.')
+  if reader == 'show':
+    return show_state(source)
+  with open(source, 'r') as statefd:
+    return load_state(statefd, source, reader, profile)
+
+def index_resources(terraformstate):
+  # Walk the module tree of a 'terraform show -json' document, nested child modules included, and bucket the
+  # resources by type. Modules are visited in order with an explicit stack, each resource exactly once. Deposed
+  # objects, which terraform is about to destroy, are left out, so that they do not define their hosts again.
+  resourceindex = {}
+  stack = []
+  if 'values' in terraformstate and 'root_module' in terraformstate['values']:
+    stack.append(terraformstate['values']['root_module'])
+  while stack:
+    module = stack.pop()
+    for resource in module.get('resources', []):
+      if 'deposed_key' not in resource:
+        resourceindex.setdefault(resource['type'], []).append(resource)
+    stack.extend(reversed(module.get('child_modules', [])))
+  return resourceindex
+
+def index_floating(resourceindex, floating_module):
+  # Index the floating ips of the given floating ip resource type by their fixed ip and their port id. Floating
+  # ips that are not associated have an empty fixed ip and are left out. Fixed ips that are associated with more
+  # than one floating ip are reported. The last one found is used.
+  floatingbyfixedip = {}
+  floatingbyport = {}
+  for resource in resourceindex.get(floating_module, []):
     try:
-      for child_resource_index in range(len(terraformstate['values']['root_module']['child_modules'][resource_index]['resources'])):
-        if 'openstack_compute_instance_v2' in terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['address']:
-          computeresourceattr = {}
-          computeresourceattr['id'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['id']
-          computeresourceattr['metadata_cluster'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']['cluster']
-          if 'ansible_extra_groups' in terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata'] and terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']['ansible_extra_groups']:
-            computeresourceattr['metadata_ansible_extra_groups'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']['ansible_extra_groups']
-          if 'ansible_port' in terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']:
-            computeresourceattr['metadata_ansible_port'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']['ansible_port']
-          if 'ansible_user' in terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']:
-            computeresourceattr['metadata_ansible_user'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']['ansible_user']
-          if 'ansible_ssh_private_key_file' in terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']:
-            computeresourceattr['metadata_ansible_ssh_private_key_file'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']['ansible_ssh_private_key_file']
-          if 'ansible_python_interpreter' in terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']:
-            computeresourceattr['metadata_ansible_python_interpreter'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['metadata']['ansible_python_interpreter']
-          computeresourceattr['name'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['name']
-          try:
-            computeresourceattr['network.0.fixed_ip_v4'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['network'][int(nic)]['fixed_ip_v4']
-          except IndexError:
-            sys.stderr.write('INFO ::: NIC with index '+nic+' does not exist on host with id '+computeresourceattr['id']+'. Auto revert index to 0..\n')
-            computeresourceattr['network.0.fixed_ip_v4'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['network'][0]['fixed_ip_v4']
-          allcomputeresourcesattr.append(computeresourceattr)
-        elif floating_module in terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['address']:
-          floatingresourceattr = {}
-          floatingresourceattr['fixed_ip'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['fixed_ip']
-          if floating_module == 'openstack_networking_floatingip_associate_v2':
-            floatingresourceattr['floating_ip'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['floating_ip']
-          elif floating_module == 'openstack_networking_floatingip_v2':
-            floatingresourceattr['floating_ip'] = terraformstate['values']['root_module']['child_modules'][resource_index]['resources'][child_resource_index]['values']['address']
-          allfloatingresourcesattr.append(floatingresourceattr)
+      values = resource['values']
+      floatingip = values[FLOATING_MODULES[floating_module]]
+      if values['fixed_ip']:
+        floatingbyfixedip.setdefault(values['fixed_ip'], []).append(floatingip)
+      if values.get('port_id'):
+        floatingbyport.setdefault(values['port_id'], []).append(floatingip)
     except KeyError:
-      sys.stderr.write('INFO ::: Module with no data found.\n')
-except KeyError:
-  sys.stderr.write('INFO ::: No child module resources found.\n')
-
-for cres in range(len(allcomputeresourcesattr)):
-  for fres in range(len(allfloatingresourcesattr)):
-    if allcomputeresourcesattr[cres]['network.0.fixed_ip_v4'] == allfloatingresourcesattr[fres]['fixed_ip']:
-      allcomputeresourcesattr[cres]['floating_ip'] = allfloatingresourcesattr[fres]['floating_ip']
-
-inventory = {}
-inventory['all'] = {}
-inventory['all']['children'] = {}
-
-for indexc in range(len(allcomputeresourcesattr)):
-  sshport = None
-  sshuser = None
-  sshkey = None
-  extragroups = None
-  name = allcomputeresourcesattr[indexc]['name']
+      sys.stderr.write('INFO ::: Resource '+resource['address']+' with no data found.\n')
+  for fixedip, floatingips in floatingbyfixedip.items():
+    if len(set(floatingips)) > 1:
+      sys.stderr.write('INFO ::: Fixed ip '+fixedip+' is associated with more than one floating ip ['+', '.join(floatingips)+']. Using '+floatingips[-1]+'..\n')
+  return floatingbyfixedip, floatingbyport
+
+def host_record(values, ip_type, nic, floatingbyfixedip, floatingbyport, profile):
+  # Build the record of a compute instance. Its floating ip is found by the fixed ip of the NIC, or by the port id
+  # of the NIC when no floating ip uses the fixed ip.
+  metadata = values['metadata']
+  group = metadata['cluster']
   try:
-    floatingip = allcomputeresourcesattr[indexc]['floating_ip']
-  except KeyError:
-    sys.stderr.write('INFO ::: No floating ip key exists on compute instance resources list.\n')
-    floatingip = None
-  fixedip = allcomputeresourcesattr[indexc]['network.0.fixed_ip_v4']
-  group = allcomputeresourcesattr[indexc]['metadata_cluster']
-  if 'metadata_ansible_port' in allcomputeresourcesattr[indexc]:
-    sshport = allcomputeresourcesattr[indexc]['metadata_ansible_port']
-  if 'metadata_ansible_user' in allcomputeresourcesattr[indexc]:
-    sshuser = allcomputeresourcesattr[indexc]['metadata_ansible_user']
-  if 'metadata_ansible_ssh_private_key_file' in allcomputeresourcesattr[indexc]:
-    sshkey = allcomputeresourcesattr[indexc]['metadata_ansible_ssh_private_key_file']
-  if 'metadata_ansible_python_interpreter' in allcomputeresourcesattr[indexc]:
-    python = allcomputeresourcesattr[indexc]['metadata_ansible_python_interpreter']
-  if 'metadata_ansible_extra_groups' in allcomputeresourcesattr[indexc]:
-    extragroups = allcomputeresourcesattr[indexc]['metadata_ansible_extra_groups'].split(',')
-  if group in inventory['all']['children']:
-    inventory['all']['children'][group]['hosts'][name] = {}
-    if iptype == 'floating':
-      inventory['all']['children'][group]['hosts'][name]['ansible_host'] = floatingip
-    elif iptype == 'fixed':
-      inventory['all']['children'][group]['hosts'][name]['ansible_host'] = fixedip
-    if sshport:
-      inventory['all']['children'][group]['hosts'][name]['ansible_port'] = int(sshport)
-    if sshuser:
-      inventory['all']['children'][group]['hosts'][name]['ansible_user'] = sshuser
-    if sshkey:
-      inventory['all']['children'][group]['hosts'][name]['ansible_ssh_private_key_file'] = sshkey
-    if python:
-      inventory['all']['children'][group]['hosts'][name]['ansible_python_interpreter'] = python
+    network = values['network'][nic]
+  except IndexError:
+    sys.stderr.write('INFO ::: NIC with index '+str(nic)+' does not exist on host with id '+values['id']+'. Auto revert index to 0..\n')
+    profile.count('nic_fallbacks')
+    network = values['network'][0]
+  # A NIC without an ipv4 address (an ipv6 only network) is only joined by its port id.
+  floatingips = floatingbyfixedip.get(network['fixed_ip_v4']) if network['fixed_ip_v4'] else None
+  if not floatingips and network.get('port'):
+    floatingips = floatingbyport.get(network['port'])
+  floatingip = floatingips[-1] if floatingips else None
+  if ip_type == 'floating':
+    if floatingip is None:
+      sys.stderr.write('INFO ::: No floating ip is associated with host '+values['name']+'.\n')
+      profile.count('floating_missing')
+    address = floatingip
+  else:
+    address = network['fixed_ip_v4']
+  extragroups = ()
+  if metadata.get('ansible_extra_groups'):
+    extragroups = tuple(secgroup.strip() for secgroup in metadata['ansible_extra_groups'].split(',') if secgroup.strip() and secgroup.strip() != group)
+  return HostRecord(
+    values['name'], values['id'], group, extragroups, network['fixed_ip_v4'], network.get('port'), floatingip, address,
+    int(metadata['ansible_port']) if metadata.get('ansible_port') else None,
+    metadata.get('ansible_user') or None,
+    metadata.get('ansible_ssh_private_key_file') or None,
+    metadata.get('ansible_python_interpreter') or None,
+  )
+
+def parse_state(source, ip_type='floating', nic=0, floating_module='openstack_networking_floatingip_v2', reader='native', profile=None):
+  # Parse a terraform state and yield a HostRecord for every compute instance, in the order of the state.
+  # The source is the path or the http(s) URL of a state file, an open state file, or a decoded state document.
+  # The ip type selects the address of the hosts, 'floating' or 'fixed', of the NIC with the given index. The reader
+  # is 'native', 'stream' (keeps only compute instances and floating ips in memory) or 'show' ('terraform show -json').
+  # The state is read when the first record is requested.
+  if ip_type not in ('floating', 'fixed'):
+    raise ValueError('ip type must be one of [floating|fixed]')
+  if floating_module not in FLOATING_MODULES:
+    raise ValueError('floating module must be one of ['+'|'.join(FLOATING_MODULES)+']')
+  if reader not in READERS:
+    raise ValueError('reader must be one of ['+'|'.join(READERS)+']')
+  return parse_records(source, ip_type, int(nic), floating_module, reader, profile or Profile())
+
+def parse_records(source, ip_type, nic, floating_module, reader, profile):
+  with profile.phase('read'):
+    terraformstate = read_source(source, reader, profile)
+  with profile.phase('walk'):
+    resourceindex = index_resources(terraformstate)
+  del terraformstate
+  profile.count('resources', sum(len(resources) for resources in resourceindex.values()))
+  if 'openstack_compute_instance_v2' not in resourceindex:
+    sys.stderr.write('INFO ::: No compute instance resources found.\n')
+  with profile.phase('floating'):
+    floatingbyfixedip, floatingbyport = index_floating(resourceindex, floating_module)
+  # Only the time spent on the records is counted, not the time spent by the consumer between them.
+  seconds = 0.0
+  hosts = 0
+  for resource in resourceindex.pop('openstack_compute_instance_v2', []):
+    start = time.perf_counter()
+    try:
+      record = host_record(resource['values'], ip_type, nic, floatingbyfixedip, floatingbyport, profile)
+    except KeyError:
+      sys.stderr.write('INFO ::: Resource '+resource['address']+' with no data found.\n')
+      continue
+    finally:
+      seconds += time.perf_counter() - start
+    hosts += 1
+    yield record
+  profile.count('hosts', hosts)
+  profile.record('hosts', seconds)
+
+def build_inventory(records, profile=None):
+  # Build the inventory of host records. Every host is defined in the group of its 'cluster' metadata, with its
+  # address and connection variables. Its extra groups only refer to it.
+  profile = profile or Profile()
+  with profile.phase('build'):
+    inventory = {'all': {'children': {}}}
+    groups = inventory['all']['children']
+    for record in records:
+      hostvars = {'ansible_host': record.ansible_host}
+      for variable in HOST_VARIABLES:
+        if getattr(record, variable) is not None:
+          hostvars[variable] = getattr(record, variable)
+      groups.setdefault(record.group, {'hosts': {}})['hosts'][record.name] = hostvars
+      for secgroup in record.extra_groups:
+        groups.setdefault(secgroup, {'hosts': {}})['hosts'].setdefault(record.name, None)
+  profile.count('groups', len(groups))
+  return inventory
+
+def hoist_group_vars(inventory):
+  # Move the connection variables that all hosts of a group have in common into the vars of the group. A variable
+  # is only hoisted when every host of the group has the same value for it, so that a host in several groups never
+  # gets conflicting values from them.
+  groups = inventory['all']['children']
+  hostvariables = {}
+  for group in groups:
+    for name, hostvars in groups[group]['hosts'].items():
+      if hostvars:
+        hostvariables.setdefault(name, {}).update(hostvars)
+  hoisted = {}
+  hoistedinventory = {'all': {'children': {}}}
+  for group in groups:
+    names = list(groups[group]['hosts'])
+    groupvars = {}
+    if len(names) > 1:
+      for variable in HOISTED_VARIABLES:
+        values = [hostvariables.get(name, {}).get(variable) for name in names]
+        if values[0] is not None and values.count(values[0]) == len(values):
+          groupvars[variable] = values[0]
+    for name in names:
+      hoisted.setdefault(name, set()).update(groupvars)
+    hoistedinventory['all']['children'][group] = {'hosts': {}}
+    if groupvars:
+      hoistedinventory['all']['children'][group]['vars'] = groupvars
+  for group in groups:
+    for name, hostvars in groups[group]['hosts'].items():
+      if hostvars is not None:
+        hostvars = dict((variable, value) for variable, value in hostvars.items() if variable not in hoisted[name])
+      hoistedinventory['all']['children'][group]['hosts'][name] = hostvars
+  return hoistedinventory
+
+def ini_value(value):
+  # Format a variable value for an ini inventory, quoting it when needed.
+  text = str(value)
+  if not text or re.search(r'[\s"\'#;=]', text):
+    return json.dumps(text)
+  return text
+
+def dump_inventory(inventory, outputformat):
+  # Serialise the inventory in the given format: yaml (through the libyaml dumper when available), json or ini.
+  if outputformat == 'json':
+    return json.dumps(inventory, indent=2, sort_keys=True)+'\n'
+  if outputformat == 'ini':
+    lines = []
+    groups = inventory['all']['children']
+    for group in sorted(groups):
+      lines.append('['+group+']')
+      for name in sorted(groups[group]['hosts']):
+        hostvars = groups[group]['hosts'][name] or {}
+        lines.append(' '.join([name]+[variable+'='+ini_value(value) for variable, value in sorted(hostvars.items()) if value is not None]))
+      if groups[group].get('vars'):
+        lines.append('')
+        lines.append('['+group+':vars]')
+        for variable, value in sorted(groups[group]['vars'].items()):
+          lines.append(variable+'='+ini_value(value))
+      lines.append('')
+    return '\n'.join(lines)
+  return yaml.dump(inventory, Dumper=YAML_DUMPER, default_flow_style=False)
+
+def location_inventory(location, options):
+  # Generate the inventory of a single state location with the given options. Inventories are cached per state
+  # location and options.
+  # For a local state file the cached inventory is reused while the lineage and serial of the state stay the same.
+  # A remote state file is requested conditionally, with the validators stored along with the cached inventory,
+  # and the cached inventory is reused when it has not changed.
+  inventory = None
+  validator = None
+  source = location
+  if location.startswith('http://') or location.startswith('https://'):
+    cachelocation = location
+    cacheentry = None
+    if options.usecache and not options.refresh:
+      cacheentry = read_cache(cachelocation, options)
+    response = fetch_state(location, cacheentry and cacheentry.get('validator'))
+    if response is None:
+      inventory = cacheentry['inventory']
+      save_cache(cachelocation, cacheentry['validator'], inventory, options)
+    else:
+      validator = response_validator(response)
+      source = load_state(response_stream(response), location, options.reader)
+      # Read what is left of the body, so that the connection can be used for the next request.
+      response.read()
+  else:
+    cachelocation = os.path.abspath(location)
+    if not (os.path.exists(location) and os.access(location, os.R_OK)):
+      raise InventoryError(710, 'Input file ['+location+'] could not be found or read.')
+    if options.usecache:
+      validator = state_header(location)
+    if validator and not options.refresh:
+      inventory = load_cache(cachelocation, validator, options)
+
+  if inventory is None:
+    inventory = build_inventory(parse_state(source, options.iptype, options.nic, options.floating_module, options.reader))
+    if options.usecache and validator:
+      save_cache(cachelocation, validator, inventory, options)
+  return inventory
+
+def expand_locations(locationargs):
+  # Expand the glob patterns among the state locations. Patterns are expanded in sorted order, so that the
+  # order of the states, and with it the result of merging them, does not depend on the file system.
+  locations = []
+  for locationarg in locationargs:
+    if locationarg.startswith('http://') or locationarg.startswith('https://') or not glob.has_magic(locationarg):
+      matches = [locationarg]
+    else:
+      # A pattern without matches is kept, so that it is reported like a missing file.
+      matches = sorted(glob.glob(locationarg, recursive=True)) or [locationarg]
+    for match in matches:
+      if match not in locations:
+        locations.append(match)
+  return locations
+
+def state_label(location, parents=0):
+  # Short name of a state location, used as the prefix of its groups with --group-prefix. This is the name of the
+  # directory of a 'terraform.tfstate' file, or the name of the state file without its extension otherwise,
+  # preceded by the names of the given number of parent directories.
+  if location.startswith('http://') or location.startswith('https://'):
+    path = urllib.parse.urlsplit(location).path.rstrip('/')
   else:
-    inventory['all']['children'][group] = {}
-    inventory['all']['children'][group]['hosts'] = {}
-    inventory['all']['children'][group]['hosts'][name] = {}
-    if iptype == 'floating':
-      inventory['all']['children'][group]['hosts'][name]['ansible_host'] = floatingip
-    elif iptype == 'fixed':
-      inventory['all']['children'][group]['hosts'][name]['ansible_host'] = fixedip
-    if sshport:
-      inventory['all']['children'][group]['hosts'][name]['ansible_port'] = int(sshport)
-    if sshuser:
-      inventory['all']['children'][group]['hosts'][name]['ansible_user'] = sshuser
-    if sshkey:
-      inventory['all']['children'][group]['hosts'][name]['ansible_ssh_private_key_file'] = sshkey
-    if python:
-      inventory['all']['children'][group]['hosts'][name]['ansible_python_interpreter'] = python
-  if extragroups:
-    for secgroup in extragroups:
-      if secgroup in inventory['all']['children']:
-        inventory['all']['children'][secgroup]['hosts'][name] = {}
-        if iptype == 'floating':
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_host'] = floatingip
-        elif iptype == 'fixed':
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_host'] = fixedip
-        if sshport:
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_port'] = int(sshport)
-        if sshuser:
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_user'] = sshuser
-        if sshkey:
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_ssh_private_key_file'] = sshkey
-        if python:
-          inventory['all']['children'][group]['hosts'][name]['ansible_python_interpreter'] = python
+    path = os.path.abspath(location).rstrip(os.sep)
+  name = os.path.basename(path).split('.')[0]
+  if name in ('', 'terraform'):
+    path = os.path.dirname(path)
+    name = os.path.basename(path)
+  for parent in range(parents):
+    path = os.path.dirname(path)
+    if os.path.basename(path):
+      name = os.path.basename(path)+'_'+name
+  return re.sub(r'[^A-Za-z0-9_]', '_', name)
+
+def state_labels(locations):
+  # Labels of several state locations, which tell the states apart. Labels that collide, like the ones of
+  # 'prod/eu/terraform.tfstate' and 'test/eu/terraform.tfstate', are extended with the names of parent directories
+  # until they differ ('prod_eu' and 'test_eu'). Labels that still collide are numbered in the order of the states.
+  labels = [state_label(location) for location in locations]
+  for parents in range(1, 64):
+    collisions = set(label for label in labels if labels.count(label) > 1)
+    if not collisions:
+      return labels
+    labels = [state_label(location, parents) if label in collisions else label for location, label in zip(locations, labels)]
+  collisions = set(label for label in labels if labels.count(label) > 1)
+  return [label+'_'+str(index+1) if label in collisions else label for index, label in enumerate(labels)]
+
+def batch_inventories(locations, options):
+  # Generate the inventories of several state locations in a pool of options.jobs worker processes. Returns a list
+  # with the inventory, or the error, of every location, in the order of the locations.
+  results = []
+  with concurrent.futures.ProcessPoolExecutor(max_workers=min(options.jobs, len(locations))) as executor:
+    futures = [executor.submit(location_inventory, location, options) for location in locations]
+    for location, future in zip(locations, futures):
+      try:
+        results.append(future.result())
+      except InventoryError as inverr:
+        results.append(inverr)
+      except Exception as err:
+        results.append(InventoryError(716, 'Error when processing terraform state file ['+location+']. Reason: '+repr(err)))
+  return results
+
+def merge_inventories(locations, inventories, groupprefix=False):
+  # Merge the inventories of several states into one, in the order of the states. Groups collect the hosts of
+  # all states, prefixed with the label of their state when groupprefix is set. A host that is defined again by
+  # a later state with different variables keeps the variables of the first state, and the conflict is reported.
+  merged = {'all': {'children': {}}}
+  hostvariables = {}
+  hostlocations = {}
+  for location, label, inventory in zip(locations, state_labels(locations), inventories):
+    prefix = label+'_' if groupprefix else ''
+    statehosts = {}
+    for group in inventory['all']['children']:
+      for name, hostvars in inventory['all']['children'][group]['hosts'].items():
+        statehosts.setdefault(name, {}).update(hostvars or {})
+    for name in statehosts:
+      if name not in hostlocations:
+        hostlocations[name] = location
+        hostvariables[name] = statehosts[name]
+      elif hostvariables[name] != statehosts[name]:
+        sys.stderr.write('INFO ::: Host '+name+' of ['+location+'] is already defined by ['+hostlocations[name]+'] with different variables. Keeping the first one..\n')
+    for group in inventory['all']['children']:
+      for name, hostvars in inventory['all']['children'][group]['hosts'].items():
+        if hostlocations[name] == location or hostvariables[name] == statehosts[name]:
+          mergedhosts = merged['all']['children'].setdefault(prefix+group, {'hosts': {}})['hosts']
+          if mergedhosts.get(name) is None:
+            mergedhosts[name] = hostvars
+  return merged
+
+def write_inventory(inventorytext):
+  # Write the inventory file. The file is replaced atomically, so that ansible never reads a partially written inventory.
+  inventoryfd, inventorytmp = tempfile.mkstemp(dir='.', prefix='.inventory', suffix='.tmp')
+  try:
+    with os.fdopen(inventoryfd, 'w') as inventoryfile:
+      inventoryfile.write(inventorytext)
+    # mkstemp creates private files, the inventory file gets the permissions of a newly created file instead.
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(inventorytmp, 0o666 & ~umask)
+    os.replace(inventorytmp, 'inventory')
+  except OSError:
+    if os.path.exists(inventorytmp):
+      os.unlink(inventorytmp)
+    raise
+
+def host_table(inventory):
+  # Index the groups of every host of an inventory, with the variables of the host in each group (None where the
+  # group only refers to the host). Two inventories define a host the same way when its entries are equal.
+  table = {}
+  for group in inventory['all']['children']:
+    for name, hostvars in inventory['all']['children'][group]['hosts'].items():
+      table.setdefault(name, {})[group] = hostvars
+  return table
+
+def inventory_changes(previoustable, currenttable):
+  # Compare the host tables of two inventories. Returns the sorted names of the added, removed and changed hosts.
+  added = sorted(name for name in currenttable if name not in previoustable)
+  removed = sorted(name for name in previoustable if name not in currenttable)
+  changed = sorted(name for name in currenttable if name in previoustable and currenttable[name] != previoustable[name])
+  return added, removed, changed
+
+def apply_changes(inventory, previoustable, currenttable, names):
+  # Update the given hosts of an inventory in place, from their entries in the previous and the current host table.
+  # Groups left without hosts are removed. Returns the names of the groups that were updated.
+  groups = inventory['all']['children']
+  updated = set()
+  for name in names:
+    for group in previoustable.get(name, {}):
+      del groups[group]['hosts'][name]
+      if not groups[group]['hosts']:
+        del groups[group]
+      updated.add(group)
+    for group, hostvars in currenttable.get(name, {}).items():
+      groups.setdefault(group, {'hosts': {}})['hosts'][name] = hostvars
+      updated.add(group)
+  return updated
+
+class StateWatcher(object):
+  # Wait for changes of a local state file. On Linux the directory of the file is watched with inotify, so that both
+  # rewriting the file in place and replacing it are noticed at once. Without inotify, the file is checked every
+  # interval. In both cases the file counts as changed when its inode, modification time or size is different.
+  def __init__(self, statefile, interval):
+    self.statefile = statefile
+    self.interval = interval
+    self.inotifyfd = None
+    self.signature = self.stat()
+    try:
+      libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+      inotifyfd = libc.inotify_init()
+    except (OSError, AttributeError):
+      return
+    if inotifyfd < 0:
+      return
+    if libc.inotify_add_watch(inotifyfd, os.fsencode(os.path.dirname(os.path.abspath(statefile))), INOTIFY_EVENTS) < 0:
+      os.close(inotifyfd)
+      return
+    self.inotifyfd = inotifyfd
+
+  def stat(self):
+    try:
+      statinfo = os.stat(self.statefile)
+    except OSError:
+      return None
+    return (statinfo.st_ino, statinfo.st_mtime_ns, statinfo.st_size)
+
+  def wait(self):
+    # Block until the state file has changed since the previous call. Events of other files in the directory are
+    # drained and ignored. The file is still checked every interval, in case an event is missed.
+    while True:
+      if self.inotifyfd is not None:
+        if select.select([self.inotifyfd], [], [], self.interval)[0]:
+          os.read(self.inotifyfd, 65536)
       else:
-        inventory['all']['children'][secgroup] = {}
-        inventory['all']['children'][secgroup]['hosts'] = {}
-        inventory['all']['children'][secgroup]['hosts'][name] = {}
-        if iptype == 'floating':
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_host'] = floatingip
-        elif iptype == 'fixed':
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_host'] = fixedip
-        if sshport:
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_port'] = int(sshport)
-        if sshuser:
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_user'] = sshuser
-        if sshkey:
-          inventory['all']['children'][secgroup]['hosts'][name]['ansible_ssh_private_key_file'] = sshkey
-        if python:
-          inventory['all']['children'][group]['hosts'][name]['ansible_python_interpreter'] = python
-
-with open('inventory', 'w') as outfile:
-  print(yaml.safe_dump(inventory, outfile, default_flow_style=False))
-print(yaml.safe_dump(inventory, default_flow_style=False))
+        time.sleep(self.interval)
+      signature = self.stat()
+      if signature != self.signature:
+        self.signature = signature
+        return
+
+class InventoryHandler(http.server.BaseHTTPRequestHandler):
+  # Serve the current inventory: '/' in the output format, '/list' and '/host/<host>' as the JSON documents of
+  # --list and --host. Responses carry an ETag, so that controllers can poll the inventory with conditional requests.
+  def do_GET(self):
+    current = self.server.published
+    path = urllib.parse.urlsplit(self.path).path
+    if current is None:
+      self.send_error(503)
+      return
+    if path == '/':
+      body = current['inventory']
+      contenttype = current['contenttype']
+    elif path == '/list':
+      body = current['list']
+      contenttype = 'application/json'
+    elif path.startswith('/host/'):
+      body = json.dumps(current['hostvars'].get(urllib.parse.unquote(path[len('/host/'):]), {})).encode('utf-8')
+      contenttype = 'application/json'
+    else:
+      self.send_error(404)
+      return
+    etag = '"'+current['tag']+'"'
+    if self.headers.get('If-None-Match') == etag:
+      self.send_response(304)
+      self.send_header('ETag', etag)
+      self.end_headers()
+      return
+    self.send_response(200)
+    self.send_header('Content-Type', contenttype+'; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    self.send_header('ETag', etag)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+def publish_inventory(server, inventory, hoistedinventory, inventorytext, outputformat):
+  # Replace the inventory served over HTTP by the server. The documents are serialised once here, not for every
+  # request, and swapped in one step, so that a request never sees parts of two inventories.
+  server.published = {
+    'inventory': inventorytext.encode('utf-8'),
+    'contenttype': {'json': 'application/json', 'ini': 'text/plain'}.get(outputformat, 'application/yaml'),
+    'list': json.dumps(inventory_list(hoistedinventory)).encode('utf-8'),
+    'hostvars': inventory_list(inventory)['_meta']['hostvars'],
+    'tag': hashlib.sha256(inventorytext.encode('utf-8')).hexdigest()[:32],
+  }
+
+def serve_inventory(address):
+  # Start serving the inventory over HTTP in a background thread, and return the server. The address is
+  # '[<address>:]<port>', and the inventory is served on the loopback interface when no address is given.
+  # Requests are answered with 503 until an inventory is published.
+  host, separator, port = address.rpartition(':')
+  try:
+    server = http.server.ThreadingHTTPServer((host.strip('[]') or '127.0.0.1', int(port)), InventoryHandler)
+  except (OSError, ValueError) as serveerr:
+    raise InventoryError(717, 'Could not serve the inventory on ['+address+']. Reason: '+str(serveerr))
+  server.daemon_threads = True
+  server.published = None
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  return server
+
+def emit_inventory(inventory, options, server=None):
+  # Write the inventory file and publish the inventory on the server, if any. Returns the inventory text.
+  hoistedinventory = hoist_group_vars(inventory)
+  inventorytext = dump_inventory(hoistedinventory, options.outputformat)
+  write_inventory(inventorytext)
+  if server is not None:
+    publish_inventory(server, inventory, hoistedinventory, inventorytext, options.outputformat)
+  return inventorytext
+
+def watch_inventory(location, inventory, options, server=None):
+  # Update the inventory whenever the state changes, until interrupted. A local state file is only processed again
+  # when its lineage or serial changed, a remote one when the server does not answer the conditional request of the
+  # cached inventory with 304. The hosts of the new inventory are compared with the current ones, and only the
+  # added, removed and changed hosts, and their groups, are updated before the inventory file is rewritten.
+  currenttable = host_table(inventory)
+  remote = location.startswith('http://') or location.startswith('https://')
+  if not remote:
+    watcher = StateWatcher(location, options.interval)
+    header = state_header(location)
+    serial = header and (header['lineage'], header['serial'])
+  while True:
+    if remote:
+      time.sleep(options.interval)
+    else:
+      watcher.wait()
+      header = state_header(location)
+      if header is not None and (header['lineage'], header['serial']) == serial:
+        continue
+    try:
+      stateinventory = location_inventory(location, options)
+    except InventoryError as inverr:
+      sys.stderr.write('Error['+str(inverr.code)+'] ::: '+inverr.message+'\nKeeping the current inventory.\n')
+      continue
+    if not remote:
+      serial = header and (header['lineage'], header['serial'])
+    statetable = host_table(stateinventory)
+    added, removed, changed = inventory_changes(currenttable, statetable)
+    if not (added or removed or changed):
+      continue
+    groups = apply_changes(inventory, currenttable, statetable, added + removed + changed)
+    currenttable = statetable
+    try:
+      emit_inventory(inventory, options, server)
+    except OSError as oserr:
+      sys.stderr.write('INFO ::: Could not write the inventory file. Reason: '+str(oserr)+'\n')
+    sys.stderr.write('INFO ::: Inventory updated: '+str(len(added))+' hosts added, '+str(len(removed))+' removed, '+str(len(changed))+' changed, in groups ['+', '.join(sorted(groups))+'].\n')
+
+def main(argv):
+  options = Options()
+  try:
+    longopts = ['terraform-show', 'stream', 'list', 'host=', 'refresh', 'no-cache', 'cache-ttl=', 'cache-dir=', 'jobs=', 'group-prefix', 'format=', 'watch', 'interval=', 'serve=']
+    opts, args = getopt.gnu_getopt(argv, '', longopts)
+    # Ansible runs dynamic inventory scripts with --list or --host only. The remaining arguments are then read from the environment.
+    if not args and [opt for opt, optarg in opts if opt in ('--list', '--host')]:
+      envopts, args = getopt.gnu_getopt(shlex.split(os.environ.get('TFSTATE2INVENTORY_ARGS', '')), '', longopts)
+      opts = envopts + opts
+    for opt, optarg in opts:
+      if opt == '--cache-ttl':
+        options.cachettl = int(optarg)
+      elif opt == '--jobs':
+        options.jobs = max(1, int(optarg))
+      elif opt == '--interval':
+        options.interval = float(optarg)
+        if options.interval <= 0:
+          raise ValueError('option --interval requires a positive number of seconds')
+  except (getopt.GetoptError, ValueError) as opterr:
+    sys.stderr.write('Error[712] ::: '+USAGE+'\n'+str(opterr)+'\n')
+    sys.exit(712)
+  for opt, optarg in opts:
+    if opt == '--terraform-show':
+      options.reader = 'show'
+    elif opt == '--stream':
+      options.reader = 'stream'
+    elif opt == '--list':
+      options.listing = True
+    elif opt == '--host':
+      options.hostname = optarg
+    elif opt == '--refresh':
+      options.refresh = True
+    elif opt == '--no-cache':
+      options.usecache = False
+    elif opt == '--cache-dir':
+      options.cachedir = optarg
+    elif opt == '--group-prefix':
+      options.groupprefix = True
+    elif opt == '--format':
+      options.outputformat = optarg
+    elif opt == '--watch':
+      options.watching = True
+    elif opt == '--serve':
+      options.serveaddress = optarg
+  if len(set(opt for opt, optarg in opts if opt in ('--terraform-show', '--stream'))) > 1:
+    sys.stderr.write('Error[712] ::: '+USAGE+'\nOptions --terraform-show and --stream cannot be used together.\n')
+    sys.exit(712)
+  if options.listing and options.hostname is not None:
+    sys.stderr.write('Error[712] ::: '+USAGE+'\nOptions --list and --host cannot be used together.\n')
+    sys.exit(712)
+  if options.outputformat not in OUTPUT_FORMATS:
+    sys.stderr.write('Error[712] ::: '+USAGE+'\nOption --format must be one of ['+'|'.join(OUTPUT_FORMATS)+'].\n')
+    sys.exit(712)
+  if options.watching and (options.listing or options.hostname is not None):
+    sys.stderr.write('Error[712] ::: '+USAGE+'\nOption --watch cannot be used together with --list or --host.\n')
+    sys.exit(712)
+  if options.serveaddress is not None and not options.watching:
+    sys.stderr.write('Error[712] ::: '+USAGE+'\nOption --serve can only be used together with --watch.\n')
+    sys.exit(712)
+  # Inventories are only cached for ansible, which runs the script for every playbook, and for the watch mode, which
+  # requests remote states with the validators of the cache. Generating the inventory file reads the state every time.
+  if not (options.listing or options.hostname is not None or options.watching):
+    options.usecache = False
+
+  # All arguments before the ip type are state locations.
+  locationargs = []
+  while len(locationargs) < len(args) and args[len(locationargs)] not in ('floating', 'fixed'):
+    locationargs.append(args[len(locationargs)])
+  args = args[len(locationargs):]
+
+  if len(locationargs) == 0:
+    sys.stderr.write('Error[700] ::: '+USAGE+'\nFirst arguments are the paths, glob patterns or URLs of terraform state files. Next, optional argument is the word "floating" or "fixed" that defines which IP address is going to be used to generate inventory. Next optional argument is the index of the NIC that is going to be used for remote communication by ansible (in case of multiple networks attached to a host). Defaults to 0 which is the first NIC of the host. Last optional argument is the type of the floating ip used. Floating IPs can be derived from the floatingip module of terraform when floating IPs are created dynamically through the build process, or from the floatingip_associate module, when floating IPs already exist into the project and are associated with dynamically create ports of the project. Defaults to ip, assuming that floating IPs are created by the build process.\n')
+    sys.exit(700)
+  elif len(args) == 3:
+    options.iptype = args[0]
+    options.nic = args[1]
+    if args[2] == 'ip':
+      options.floating_module = 'openstack_networking_floatingip_v2'
+    elif args[2] == 'associate':
+      options.floating_module = 'openstack_networking_floatingip_associate_v2'
+    else:
+      sys.stderr.write('Error[702] ::: '+USAGE+'\nArgument after the state locations must be one of [floating|fixed]. Next the index of the NIC that is going to be used for remote communication. Usually a number between 0-2.\nLast argument must be one of [ip|associate].\n')
+      sys.exit(702)
+  elif len(args) == 2:
+    options.iptype = args[0]
+    options.nic = args[1]
+  elif len(args) == 1:
+    options.iptype = args[0]
+  elif len(args) != 0:
+    sys.stderr.write('Error[706] ::: '+USAGE+'\nArgument after the state locations must be one of [floating|fixed]. Next the index of the NIC that is going to be used for remote communication. Usually a number between 0-2.\nLast argument must be one of [ip|associate].\n')
+    sys.exit(706)
+
+  # A word after the first state location that is neither a URL, a glob pattern, a path nor an existing file is
+  # a misspelled ip type, e.g. 'flaoting'. It is reported like a wrong ip type, not as a missing state file.
+  for index in range(1, len(locationargs)):
+    locationarg = locationargs[index]
+    if not (locationarg.startswith('http://') or locationarg.startswith('https://') or glob.has_magic(locationarg) or os.sep in locationarg or '.' in locationarg or os.path.exists(locationarg)):
+      errorcode = {3: 701, 2: 703, 1: 704}.get(len(locationargs) - index + len(args), 706)
+      sys.stderr.write('Error['+str(errorcode)+'] ::: '+USAGE+'\nArgument after the state locations must be one of [floating|fixed], not ['+locationarg+']. Next the index of the NIC that is going to be used for remote communication. Usually a number between 0-2.\nLast argument must be one of [ip|associate].\n')
+      sys.exit(errorcode)
+
+  locations = expand_locations(locationargs)
+  if options.watching and len(locations) != 1:
+    sys.stderr.write('Error[712] ::: '+USAGE+'\nOption --watch requires a single state file or URL.\n')
+    sys.exit(712)
+  if len(locations) == 1:
+    try:
+      inventory = location_inventory(locations[0], options)
+    except InventoryError as inverr:
+      sys.stderr.write('Error['+str(inverr.code)+'] ::: '+inverr.message+'\n')
+      sys.exit(inverr.code)
+    failures = 0
+  else:
+    # Several states are processed in parallel, and a failing state does not stop the others.
+    inventories = batch_inventories(locations, options)
+    failures = 0
+    for inventory in inventories:
+      if isinstance(inventory, InventoryError):
+        sys.stderr.write('Error['+str(inventory.code)+'] ::: '+inventory.message+'\n')
+        failures += 1
+    processed = [(location, inventory) for location, inventory in zip(locations, inventories) if not isinstance(inventory, InventoryError)]
+    if not processed:
+      sys.stderr.write('Error[715] ::: None of the '+str(len(locations))+' terraform state files could be processed.\n')
+      sys.exit(715)
+    inventory = merge_inventories([location for location, inventory in processed], [inventory for location, inventory in processed], options.groupprefix)
+
+  if options.listing:
+    print(json.dumps(inventory_list(hoist_group_vars(inventory))))
+  elif options.hostname is not None:
+    print(json.dumps(inventory_list(inventory)['_meta']['hostvars'].get(options.hostname, {})))
+  elif options.watching:
+    # The inventory is only written into the inventory file, the standard output is not flooded with every update.
+    try:
+      server = None
+      if options.serveaddress is not None:
+        server = serve_inventory(options.serveaddress)
+      emit_inventory(inventory, options, server)
+      sys.stderr.write('INFO ::: Watching ['+locations[0]+'] for changes.\n')
+      watch_inventory(locations[0], inventory, options, server)
+    except InventoryError as inverr:
+      sys.stderr.write('Error['+str(inverr.code)+'] ::: '+inverr.message+'\n')
+      sys.exit(inverr.code)
+    except KeyboardInterrupt:
+      pass
+  else:
+    inventorytext = dump_inventory(hoist_group_vars(inventory), options.outputformat)
+    write_inventory(inventorytext)
+    sys.stdout.write(inventorytext)
+
+  if failures:
+    sys.stderr.write('Error[715] ::: '+str(failures)+' of '+str(len(locations))+' terraform state files could not be processed.\n')
+    sys.exit(715)
+
+if __name__ == '__main__':
+  main(sys.argv[1:])